@@ -1,32 +1,133 @@
-from predict import EloRatingSystem
-
-def process_matches_in_batches(elo_system, match_file, batch_size=10):
-    with open(match_file, 'r') as file:
-        lines = file.readlines()
-
-    for batch_number in range(0, len(lines), batch_size):
-        batch = lines[batch_number:batch_number + batch_size]
-        process_batch(elo_system, batch)
-
-def process_batch(elo_system, batch):
-    for line_number, line in enumerate(batch):
-        line = line.strip().rstrip(',')
-        if line.startswith("(") and line.endswith(")"):
-            line = line[1:-1].replace('"', '').replace("'", "")
-            try:
-                team_a, team_b, result = [x.strip() for x in line.split(',')]
-                print(f"Processing match: {team_a} vs {team_b} - Result: {result}")
-                elo_system.update_ratings(team_a, team_b, result)
-            except ValueError:
-                print(f"Invalid format in line {line_number + 1}: {line}")
-        else:
-            print(f"Skipping invalid line format: {line}")
+import argparse
+import hashlib
+import json
+import os
+from itertools import islice
+
+from match_parser import iter_numbered_matches
+from profiling import count, timed
+from rating_core import format_elo_lines, format_form_lines, write_atomic
+from recent_form import FormRatingSystem
+
+def load_checkpoint(checkpoint_file):
+    """Load the checkpoint entry of each match file."""
+    try:
+        with open(checkpoint_file, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """Save the checkpoint entry of each match file atomically."""
+    write_atomic(checkpoint_file, [json.dumps(checkpoint, indent=2, sort_keys=True) + '\n'])
+
+def fingerprint(text):
+    """Short hash identifying the contents of a state file."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def file_fingerprint(file_path):
+    """Fingerprint of a file's contents, or None if it does not exist."""
+    try:
+        with open(file_path, 'r') as file:
+            return fingerprint(file.read())
+    except FileNotFoundError:
+        return None
+
+def resume_line(form_system, entry):
+    """Line to resume a match file from, settling a batch left pending by an interrupted run.
+
+    A pending batch was saved if both state files hold the contents it was
+    going to write, and was not saved if neither does.
+    """
+    if not isinstance(entry, dict):
+        return entry  # Older checkpoints only hold the line number
+    pending = entry.get("pending")
+    if pending is None:
+        return entry["line"]
+    saved = [file_fingerprint(form_system.elo_file) == pending["elo"],
+             file_fingerprint(form_system.form_file) == pending["form"]]
+    if all(saved):
+        return pending["line"]
+    if not any(saved):
+        return entry["line"]
+    raise ValueError(f"Only one of {form_system.elo_file} and {form_system.form_file} holds the batch ending at "
+                     f"line {pending['line']}; restore both from a backup before ingesting again.")
+
+def process_matches_in_batches(form_system, match_file, batch_size=10, checkpoint_file=None, verbose=False,
+                               errors=None):
+    """Apply new matches from a match file to Elo and form state, batch_size matches at a time.
+
+    Each batch is applied in memory and saved once. With a checkpoint file,
+    matches up to the last saved line are skipped on the next run: before a
+    batch is saved, the checkpoint records it as pending together with
+    fingerprints of the state it is about to write, and once it is saved
+    the checkpoint moves on. The form system's flush_interval is suspended
+    meanwhile, since a flush in the middle of a batch would save state the
+    checkpoint does not know about. Invalid lines are skipped and their
+    errors appended to `errors` if given. Returns the number of matches
+    applied.
+    """
+    checkpoint = load_checkpoint(checkpoint_file) if checkpoint_file else {}
+    checkpoint_key = os.path.abspath(match_file)
+    start_line = resume_line(form_system, checkpoint.get(checkpoint_key, 0))
+
+    matches = iter_numbered_matches(match_file, strict=False, verbose=verbose, start_line=start_line, errors=errors)
+    processed = 0
+    flush_interval = form_system.flush_interval
+    if checkpoint_file:
+        form_system.flush_interval = None
+    try:
+        while True:
+            batch = list(islice(matches, batch_size))
+            if not batch:
+                break
+            with form_system.batch():  # The state is saved when this block exits
+                last_line = process_batch(form_system, batch)
+                if checkpoint_file:
+                    pending = {"line": last_line,
+                               "elo": fingerprint("".join(format_elo_lines(form_system.elo_ratings))),
+                               "form": fingerprint("".join(format_form_lines(form_system.recent_form_history)))}
+                    checkpoint[checkpoint_key] = {"line": start_line, "pending": pending}
+                    save_checkpoint(checkpoint_file, checkpoint)
+            processed += len(batch)
+            start_line = last_line
+            if checkpoint_file:
+                checkpoint[checkpoint_key] = {"line": last_line}
+                save_checkpoint(checkpoint_file, checkpoint)
+    finally:
+        form_system.flush_interval = flush_interval
+    return processed
+
+@timed("ingest.process_batch")
+def process_batch(form_system, batch):
+    """Apply a batch of (line_number, match) pairs, save once and return the last line number."""
+    form_system.update_matches(match for _, match in batch)
+    count("ingest.matches", len(batch))
+    return batch[-1][0]
 
 if __name__ == "__main__":
-    match_file = "data/Spanish data 2023.txt"
-    elo_system = EloRatingSystem()
+    parser = argparse.ArgumentParser(description="Ingest match files into Elo and form state.")
+    parser.add_argument("match_files", nargs="*", default=["data/Spanish data 2023.txt"])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--checkpoint", default="ingest_checkpoint.json", help="Checkpoint file of processed lines")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Ingest whole files and record nothing")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    form_system = FormRatingSystem()
+    checkpoint_file = None if args.no_checkpoint else args.checkpoint
 
-    # Run batch processing with a batch size of 10
-    process_matches_in_batches(elo_system, match_file, batch_size=1)
+    for match_file in args.match_files:
+        invalid_lines = []
+        try:
+            processed = process_matches_in_batches(form_system, match_file, batch_size=args.batch_size,
+                                                   checkpoint_file=checkpoint_file, verbose=args.verbose,
+                                                   errors=invalid_lines)
+        except FileNotFoundError:
+            print(f"File {match_file} not found.")
+            continue
+        print(f"{match_file}: {processed} new matches processed.")
+        if invalid_lines:
+            print(f"{match_file}: {len(invalid_lines)} invalid lines skipped (use --verbose to list them).")
 
     print("Batch processing complete.")
@@ -0,0 +1,198 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from match_dataset import has_dates, load_matches, market_probabilities
+from league_state import league_of
+from match_parser import RESULTS
+from optimize_weights import chronological, outcome_probabilities, walk_forward_features, weighted_expectations
+from rating_core import ModelParams
+from replay_engine import ReplayEngine
+
+OUTCOMES = RESULTS  # Probability columns, in result code order
+
+
+class BacktestReport:
+    def __init__(self, buckets=10):
+        """Running totals for accuracy, log-loss, Brier score and calibration buckets."""
+        self.buckets = buckets
+        self.matches = 0
+        self.correct = 0
+        self.log_loss_sum = 0.0
+        self.brier_sum = 0.0
+        self.bucket_count = np.zeros((len(OUTCOMES), buckets), dtype=np.int64)
+        self.bucket_predicted = np.zeros((len(OUTCOMES), buckets))  # Sum of predicted probabilities
+        self.bucket_observed = np.zeros((len(OUTCOMES), buckets))  # Number of times the outcome happened
+
+    def add(self, probabilities, outcomes):
+        """Add predictions of shape (matches, 3) in OUTCOMES order and their outcome codes."""
+        if not len(outcomes):
+            return
+        rows = np.arange(len(outcomes))
+        one_hot = np.eye(len(OUTCOMES))[outcomes]
+        self.matches += len(outcomes)
+        self.correct += int((probabilities.argmax(axis=1) == outcomes).sum())
+        self.log_loss_sum += float(-np.log(probabilities[rows, outcomes]).sum())
+        self.brier_sum += float(((probabilities - one_hot) ** 2).sum())
+        bucket = np.minimum((probabilities * self.buckets).astype(np.int64), self.buckets - 1)
+        for outcome in range(len(OUTCOMES)):
+            self.bucket_count[outcome] += np.bincount(bucket[:, outcome], minlength=self.buckets)
+            self.bucket_predicted[outcome] += np.bincount(bucket[:, outcome], probabilities[:, outcome], self.buckets)
+            self.bucket_observed[outcome] += np.bincount(bucket[:, outcome], one_hot[:, outcome], self.buckets)
+
+    def summary(self):
+        """Metrics as a JSON-serializable dictionary."""
+        matches = max(self.matches, 1)
+        calibration = {}
+        for outcome, name in enumerate(OUTCOMES):
+            calibration[name] = [
+                {
+                    "bucket": f"{index / self.buckets:.2f}-{(index + 1) / self.buckets:.2f}",
+                    "count": int(count),
+                    "mean_predicted": float(self.bucket_predicted[outcome, index] / count),
+                    "observed_rate": float(self.bucket_observed[outcome, index] / count),
+                }
+                for index, count in enumerate(self.bucket_count[outcome]) if count
+            ]
+        return {
+            "matches": self.matches,
+            "accuracy": self.correct / matches,
+            "log_loss": self.log_loss_sum / matches,
+            "brier": self.brier_sum / matches,
+            "calibration": calibration,
+        }
+
+
+def load_match_source(match_file):
+    """Load (matches, market probabilities or None) from a tuple match file or a .npy match array.
+
+    Dates and market odds come from the match array (see
+    match_dataset.load_matches), when there is one.
+    """
+    matches, dataset = load_matches(match_file)
+    return matches, market_probabilities(dataset) if dataset is not None else None
+
+
+def iter_features(match_files, params=None, load=load_match_source):
+    """Replay match files in order, yielding (match_file, league, matches, features, market) per file.
+
+    features are the walk-forward features of optimize_weights, taken from
+    the state before each match. Each league keeps its own state, and its
+    ratings are regressed by params.season_regression before every file
+    after its first. load(match_file) returns (matches, market). Dated
+    decay (params.form_half_life_days) needs files with match dates.
+    """
+    params = params if params is not None else ModelParams()
+    engines = {}
+    for match_file in match_files:
+        league = league_of(match_file)
+        engine = engines.setdefault(league, ReplayEngine(params=params))
+        matches, market = load(match_file)
+        if engine.dated_decay and not has_dates(matches):
+            raise ValueError(f"{match_file} has no match dates, which form_half_life_days needs; "
+                             "use the .npy match arrays written by data/convert_data.py.")
+        if engine.team_names:
+            engine.regress_ratings()  # New season of a league already replayed
+        yield match_file, league, matches, walk_forward_features(matches, engine), market
+
+
+def iter_predictions(match_files, params=None, weight_elo=1.0, market_weight=0.0):
+    """Replay match files in order, yielding (match_file, league, matches, probabilities, outcomes, market) per file.
+
+    Every match is predicted from the state before it is played (see
+    iter_features), and only one file is held in memory at a time.
+    probabilities has shape (matches, 3) in OUTCOMES order; market holds
+    the bookmaker implied probabilities in the same layout (NaN rows
+    without odds) or is None. With market_weight, model probabilities are
+    blended with the market where odds exist.
+    """
+    params = params if params is not None else ModelParams()
+    for match_file, league, matches, features, market in iter_features(match_files, params):
+        expected_a, expected_b = weighted_expectations(features, [weight_elo])
+        probabilities = outcome_probabilities(expected_a[0], expected_b[0], params).T
+        if market is not None and market_weight:
+            priced = ~np.isnan(market).any(axis=1)
+            probabilities[priced] = (1 - market_weight) * probabilities[priced] + market_weight * market[priced]
+        yield match_file, league, matches, probabilities, features["outcomes"], market
+
+
+def run_backtest(match_files, params=None, weight_elo=1.0, market_weight=0.0, buckets=10, on_file=None):
+    """Backtest the model over match files; returns (overall report, {league: report}, market reports).
+
+    Market reports compare {"model": ..., "market": ...} on the matches that
+    have bookmaker odds. on_file, if given, is called with each file's
+    predictions as they are produced, e.g. to stream them to disk.
+    """
+    overall = BacktestReport(buckets)
+    leagues = {}
+    market_reports = {"model": BacktestReport(buckets), "market": BacktestReport(buckets)}
+    for match_file, league, matches, probabilities, outcomes, market in iter_predictions(
+            match_files, params, weight_elo, market_weight):
+        overall.add(probabilities, outcomes)
+        leagues.setdefault(league, BacktestReport(buckets)).add(probabilities, outcomes)
+        if market is not None:
+            priced = ~np.isnan(market).any(axis=1)
+            market_reports["model"].add(probabilities[priced], outcomes[priced])
+            market_reports["market"].add(market[priced], outcomes[priced])
+        if on_file is not None:
+            on_file(match_file, league, matches, probabilities, outcomes)
+    return overall, leagues, market_reports
+
+
+def print_report(name, summary):
+    """Print one report's headline metrics and calibration table."""
+    print(f"{name}: {summary['matches']} matches, accuracy {summary['accuracy']:.2%}, "
+          f"log-loss {summary['log_loss']:.4f}, Brier {summary['brier']:.4f}")
+    for outcome, rows in summary["calibration"].items():
+        cells = ", ".join(f"{row['bucket']}: {row['mean_predicted']:.2f}/{row['observed_rate']:.2f} (n={row['count']})"
+                          for row in rows)
+        print(f"  {outcome} predicted/observed: {cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the rating model over historical match files.")
+    parser.add_argument("match_files", nargs="*", help="Match files (default: data/*.txt in chronological order)")
+    parser.add_argument("--weight-elo", type=float, default=1.0, help="Elo weight; the form weight is 1 - this")
+    parser.add_argument("--market-weight", type=float, default=0.0,
+                        help="Blend weight of bookmaker implied probabilities where odds are available")
+    parser.add_argument("--buckets", type=int, default=10, help="Number of calibration buckets")
+    parser.add_argument("--predictions", help="Stream every match prediction to this CSV file")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args()
+
+    match_files = chronological(args.match_files or glob.glob(os.path.join("data", "*.txt")))
+
+    output = open(args.predictions, 'w', newline='') if args.predictions else None
+    writer = csv.writer(output) if output else None
+    if writer:
+        writer.writerow(["file", "league", "team_a", "team_b", "result", *OUTCOMES])
+
+    def write_file(match_file, league, matches, probabilities, outcomes):
+        for (team_a, team_b, result, *_), row in zip(matches, probabilities.tolist()):
+            writer.writerow([match_file, league, team_a, team_b, result, *(f"{p:.6f}" for p in row)])
+
+    try:
+        overall, leagues, market_reports = run_backtest(match_files, weight_elo=args.weight_elo,
+                                                        market_weight=args.market_weight, buckets=args.buckets,
+                                                        on_file=write_file if writer else None)
+    finally:
+        if output:
+            output.close()
+
+    if args.json:
+        json.dump({"overall": overall.summary(), "leagues": {name: report.summary() for name, report in leagues.items()},
+                   "market_comparison": {name: report.summary() for name, report in market_reports.items()}},
+                  sys.stdout, indent=2)
+        print()
+    else:
+        print_report("Overall", overall.summary())
+        for name, report in leagues.items():
+            print_report(name, report.summary())
+        if market_reports["market"].matches:
+            print_report("Model on matches with odds", market_reports["model"].summary())
+            print_report("Bookmaker market", market_reports["market"].summary())
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import profiling
+from automated_match_adding import process_matches_in_batches
+from binary_store import import_text
+from optimize_weights import optimize_weight, walk_forward_features
+from predict import predict_fixtures
+from prediction_cache import PredictionCache
+from rating_core import EloRatingSystem, clear_stores, draw_adjusted_probabilities
+from recent_form import FormRatingSystem
+from replay_engine import ReplayEngine
+
+BENCHMARKS = ("ingest", "predict", "optimize", "startup")
+
+
+def synthetic_teams(count):
+    """Team names for a synthetic league."""
+    return [f"Team {index:03d}" for index in range(count)]
+
+
+def synthetic_matches(teams, count, seed=0):
+    """Random (team_a, team_b, result) matches whose results follow hidden team strengths."""
+    rng = random.Random(seed)
+    strength = {team: rng.gauss(1500, 100) for team in teams}
+    matches = []
+    for _ in range(count):
+        team_a, team_b = rng.sample(teams, 2)
+        expected_a = 1 / (1 + 10 ** ((strength[team_b] - strength[team_a]) / 400))
+        win_a, draw, _ = draw_adjusted_probabilities(expected_a, 1 - expected_a)
+        roll = rng.random()
+        result = "win_a" if roll < win_a else "draw" if roll < win_a + draw else "win_b"
+        matches.append((team_a, team_b, result))
+    return matches
+
+
+def write_matches(file_path, matches):
+    """Write matches as a ("A", "B", "result") tuple file."""
+    with open(file_path, 'w') as file:
+        file.writelines(f'("{team_a}", "{team_b}", "{result}"),\n' for team_a, team_b, result in matches)
+
+
+def best_of(function, repeat):
+    """Fastest of `repeat` timed calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def fresh_form_system(work_dir):
+    """FormRatingSystem on empty state files in work_dir."""
+    for name in ("teams.txt", "recent_form.txt"):
+        open(os.path.join(work_dir, name), 'w').close()
+    clear_stores()
+    return FormRatingSystem(form_file=os.path.join(work_dir, "recent_form.txt"),
+                            elo_file=os.path.join(work_dir, "teams.txt"))
+
+
+def dict_replay(form_system, matches):
+    """Apply matches through FormRatingSystem's dictionaries in memory, without saving."""
+    for team_a, team_b, result in matches:
+        form_system.update_form(team_a, team_b, result)
+        form_system.update_elo(team_a, team_b, result)
+
+
+def bench_ingest(work_dir, matches, repeat):
+    """Ingest throughput of the in-memory batch, the batched file ingest and the replay engine.
+
+    The in-memory dictionary replay is the baseline the replay engine is
+    measured against, since neither of them touches the files.
+    """
+    match_file = os.path.join(work_dir, "matches.txt")
+    write_matches(match_file, matches)
+    update_time = best_of(lambda: fresh_form_system(work_dir).update_matches(matches), repeat)
+    file_time = best_of(lambda: process_matches_in_batches(fresh_form_system(work_dir), match_file, batch_size=100),
+                        repeat)
+    dict_time = best_of(lambda: dict_replay(fresh_form_system(work_dir), matches), repeat)
+    replay_time = best_of(lambda: ReplayEngine().replay(matches), repeat)
+    return {
+        "ingest.update_matches_per_s": len(matches) / update_time,
+        "ingest.file_batches_of_100_per_s": len(matches) / file_time,
+        "ingest.dict_replay_per_s": len(matches) / dict_time,
+        "ingest.replay_engine_per_s": len(matches) / replay_time,
+        "ingest.replay_engine_speedup_x": dict_time / replay_time,
+    }
+
+
+def bench_predict(work_dir, teams, matches, repeat, samples=2000, seed=0):
+    """Single prediction latency, batch throughput and cached latency on state built from the matches."""
+    fresh_form_system(work_dir).update_matches(matches)
+    elo_system = EloRatingSystem(file_path=os.path.join(work_dir, "teams.txt"))
+    rng = random.Random(seed)
+    fixtures = [tuple(rng.sample(teams, 2)) for _ in range(samples)]
+
+    latencies = []
+    for team_a, team_b in fixtures:
+        start_time = time.perf_counter()
+        elo_system.predict_match(team_a, team_b)
+        latencies.append(time.perf_counter() - start_time)
+    latencies.sort()
+
+    batch = fixtures * 5
+    batch_time = best_of(lambda: predict_fixtures(elo_system, batch), repeat)
+
+    cache = PredictionCache(elo_system, maxsize=len(fixtures))
+    for team_a, team_b in fixtures:
+        cache.predict_match(team_a, team_b)
+    cached_time = best_of(lambda: [cache.predict_match(team_a, team_b) for team_a, team_b in fixtures], repeat)
+    return {
+        "predict.single_p50_us": latencies[len(latencies) // 2] * 1e6,
+        "predict.single_p95_us": latencies[int(len(latencies) * 0.95)] * 1e6,
+        "predict.batch_fixtures_per_s": len(batch) / batch_time,
+        "predict.cached_mean_us": cached_time / len(fixtures) * 1e6,
+    }
+
+
+def bench_optimize(matches, repeat):
+    """Wall time of building walk-forward features and optimizing the Elo weight."""
+    features = walk_forward_features(matches)
+    return {
+        "optimize.features_s": best_of(lambda: walk_forward_features(matches), repeat),
+        "optimize.log_loss_weight_s": best_of(lambda: optimize_weight(features, "log_loss"), repeat),
+        "optimize.accuracy_weight_s": best_of(lambda: optimize_weight(features, "accuracy"), repeat),
+    }
+
+
+def bench_startup(work_dir, teams, repeat):
+    """Wall time of a fresh predict.py process predicting one fixture from the text and the binary state in work_dir."""
+    fixture_file = os.path.join(work_dir, "fixtures.txt")
+    with open(fixture_file, 'w') as file:
+        file.write(f'("{teams[0]}", "{teams[1]}"),\n')
+    elo_file = os.path.join(work_dir, "teams.txt")
+    state_file = os.path.join(work_dir, "state.npy")
+    import_text(elo_file, os.path.join(work_dir, "recent_form.txt"), state_file)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "predict.py")
+    env = {key: value for key, value in os.environ.items() if key != profiling.PROFILE_ENV}
+
+    def median_time(options):
+        times = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            subprocess.run([sys.executable, script, fixture_file, *options], check=True, stdout=subprocess.DEVNULL,
+                           env=env)
+            times.append(time.perf_counter() - start_time)
+        return statistics.median(times)
+
+    return {"startup.predict_process_s": median_time(["--elo-file", elo_file]),
+            "startup.predict_state_process_s": median_time(["--state", state_file])}
+
+
+def run_benchmarks(benchmarks=BENCHMARKS, team_count=40, match_count=20000, repeat=3, seed=0):
+    """Run the selected benchmarks on synthetic data; returns {metric: value}."""
+    teams = synthetic_teams(team_count)
+    matches = synthetic_matches(teams, match_count, seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        if "ingest" in benchmarks:
+            results.update(bench_ingest(work_dir, matches, repeat))
+        if "predict" in benchmarks:
+            results.update(bench_predict(work_dir, teams, matches, repeat, seed=seed))
+        if "optimize" in benchmarks:
+            results.update(bench_optimize(matches, repeat))
+        if "startup" in benchmarks:
+            if "predict" not in benchmarks:
+                fresh_form_system(work_dir).update_matches(matches)
+            results.update(bench_startup(work_dir, teams, repeat))
+    clear_stores()
+    return results
+
+
+def find_regressions(results, baseline, tolerance=0.25):
+    """Metrics more than `tolerance` worse than the baseline, as {metric: (baseline, current)}.
+
+    Metrics ending in _per_s are throughputs and metrics ending in _x are
+    speedups (higher is better); all other metrics are times (lower is better).
+    """
+    regressions = {}
+    for name, value in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if name.endswith(("_per_s", "_x")):
+            worse = value < previous * (1 - tolerance)
+        else:
+            worse = value > previous * (1 + tolerance)
+        if worse:
+            regressions[name] = (previous, value)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, prediction, optimization and startup on synthetic data.")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--teams", type=int, default=40, help="Number of synthetic teams")
+    parser.add_argument("--matches", type=int, default=20000, help="Number of synthetic matches")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--profile", help="Also record hot-path counters and timers and write them to this JSON file")
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.benchmarks) - set(BENCHMARKS))
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    if args.profile:
+        profiling.enable()
+    results = run_benchmarks(args.benchmarks or BENCHMARKS, args.teams, args.matches, args.repeat, args.seed)
+    for name, value in results.items():
+        print(f"{name:40} {value:14.2f}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"teams": args.teams, "matches": args.matches, "results": results}, file, indent=2)
+    if args.profile:
+        profiling.dump(args.profile)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = find_regressions(results, json.load(file)["results"], args.tolerance)
+        for name, (previous, value) in regressions.items():
+            print(f"Regression in {name}: {previous:.2f} -> {value:.2f}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,201 @@
+import argparse
+import io
+from collections.abc import Mapping
+
+import numpy as np
+
+from rating_core import TeamStore, get_store, write_atomic
+
+FORM_WINDOW = 6
+
+
+def state_dtype(name_length, form_window=FORM_WINDOW):
+    """Structured dtype holding one team's rating, matches played and form per row."""
+    return np.dtype([
+        ("team", f"U{max(name_length, 1)}"),
+        ("rating", "f8"),
+        ("matches_played", "i8"),
+        ("form_score", "f8"),
+        ("form_length", "i8"),
+        ("form_history", "f8", (form_window,)),  # Oldest first, zero padded on the right
+        ("has_elo", "?"),
+        ("has_form", "?"),
+    ])
+
+
+def state_to_array(elo_ratings, recent_form_history, form_window=FORM_WINDOW):
+    """Convert Elo and form dictionaries into a structured array with lossless float ratings."""
+    teams = list(elo_ratings)
+    teams += [team for team in recent_form_history if team not in elo_ratings]
+    state = np.zeros(len(teams), dtype=state_dtype(max(map(len, teams), default=1), form_window))
+    for row, team in zip(state, teams):
+        row["team"] = team
+        if team in elo_ratings:
+            rating, matches_played = elo_ratings[team]
+            row["rating"] = rating
+            row["matches_played"] = matches_played
+            row["has_elo"] = True
+        if team in recent_form_history:
+            form_score, form_history = recent_form_history[team]
+            history = list(form_history)[-form_window:]
+            row["form_score"] = form_score
+            row["form_length"] = len(history)
+            row["form_history"][:len(history)] = history
+            row["has_form"] = True
+    return state
+
+
+def array_to_state(state):
+    """Convert a structured state array back into (elo_ratings, recent_form_history) dictionaries."""
+    elo_ratings = {}
+    recent_form_history = {}
+    teams = state["team"].tolist()
+    ratings = state["rating"].tolist()
+    matches_played = state["matches_played"].tolist()
+    form_scores = state["form_score"].tolist()
+    form_lengths = state["form_length"].tolist()
+    form_histories = state["form_history"].tolist()
+    has_elo = state["has_elo"].tolist()
+    has_form = state["has_form"].tolist()
+    for index, team in enumerate(teams):
+        if has_elo[index]:
+            elo_ratings[team] = [ratings[index], matches_played[index]]
+        if has_form[index]:
+            recent_form_history[team] = (form_scores[index], form_histories[index][:form_lengths[index]])
+    return elo_ratings, recent_form_history
+
+
+def save_binary(file_path, state):
+    """Save a structured state array as a .npy file atomically."""
+    buffer = io.BytesIO()
+    np.save(buffer, state, allow_pickle=False)
+    write_atomic(file_path, [buffer.getbuffer()], binary=True)
+
+
+def load_binary(file_path, mmap=True):
+    """Load a structured state array, memory-mapped read-only by default so startup does no parsing."""
+    return np.load(file_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+
+
+class StateTable(Mapping):
+    def __init__(self, state, table):
+        """Read-only {team: value} view of the "elo" or "form" table of a structured state array.
+
+        Only the team index is built up front; values are read from the
+        (possibly memory-mapped) array when a team is looked up, in the same
+        layout as the TeamStore dictionaries.
+        """
+        self.table = table
+        self.rating = state["rating"]
+        self.matches_played = state["matches_played"]
+        self.form_score = state["form_score"]
+        self.form_length = state["form_length"]
+        self.form_history = state["form_history"]
+        present = state["has_elo" if table == "elo" else "has_form"].tolist()
+        self.rows = {team: row for row, team in enumerate(state["team"].tolist()) if present[row]}
+
+    def __getitem__(self, team):
+        row = self.rows[team]
+        if self.table == "elo":
+            return [float(self.rating[row]), int(self.matches_played[row])]
+        return float(self.form_score[row]), self.form_history[row][:self.form_length[row]].tolist()
+
+    def __contains__(self, team):
+        return team in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ArrayTeamStore(TeamStore):
+    def __init__(self, state_file):
+        """Read-only TeamStore over a binary state file, memory-mapped so startup parses nothing.
+
+        For predictions, rankings and the prediction service. The state is
+        re-mapped by reload_elo/reload_form; updating teams is not supported.
+        """
+        super().__init__(elo_file=state_file, form_file=state_file)
+        self.state_file = state_file
+        self._state = None
+
+    @property
+    def state(self):
+        """The memory-mapped structured state array."""
+        if self._state is None:
+            self._state = load_binary(self.state_file)
+        return self._state
+
+    @property
+    def elo_ratings(self):
+        if self._elo_ratings is None:
+            self._elo_ratings = StateTable(self.state, "elo")
+        return self._elo_ratings
+
+    @property
+    def recent_form_history(self):
+        if self._recent_form_history is None:
+            self._recent_form_history = StateTable(self.state, "form")
+        return self._recent_form_history
+
+    @property
+    def form_days(self):
+        return {}
+
+    def reload_elo(self):
+        """Map the state file again, e.g. after it was replaced."""
+        self._state = self._elo_ratings = self._recent_form_history = None
+        self.invalidate()
+
+    reload_form = reload_elo
+
+    def save_elo(self):
+        raise ValueError(f"{self.state_file} is opened read-only; save state with save_binary.")
+
+    save_form = save_elo
+
+
+def load_into_store(store, file_path):
+    """Replace the dictionaries of a TeamStore in place with the state of a binary file."""
+    elo_ratings, recent_form_history = array_to_state(load_binary(file_path))
+    store.elo_ratings.clear()
+    store.elo_ratings.update(elo_ratings)
+    store.recent_form_history.clear()
+    store.recent_form_history.update(recent_form_history)
+    store.invalidate()
+    return store
+
+
+def import_text(elo_file, form_file, file_path):
+    """Convert the text Elo and form files into a binary state file."""
+    store = get_store(elo_file=elo_file, form_file=form_file)
+    state = state_to_array(store.elo_ratings, store.recent_form_history)
+    save_binary(file_path, state)
+    return len(state)
+
+
+def export_text(file_path, elo_file, form_file):
+    """Write a binary state file out as text Elo and form files."""
+    store = get_store(elo_file=elo_file, form_file=form_file)
+    load_into_store(store, file_path)
+    store.save_elo()
+    store.save_form()
+    return len(store.elo_ratings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert team state between text files and a binary .npy file.")
+    parser.add_argument("direction", choices=["import", "export"], help="import: text -> binary, export: binary -> text")
+    parser.add_argument("--binary-file", default="team_state.npy")
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--form-file", default="recent_form.txt")
+    args = parser.parse_args()
+
+    if args.direction == "import":
+        count = import_text(args.elo_file, args.form_file, args.binary_file)
+        print(f"Saved {count} teams to {args.binary_file}")
+    else:
+        count = export_text(args.binary_file, args.elo_file, args.form_file)
+        print(f"Exported {count} teams to {args.elo_file} and {args.form_file}")
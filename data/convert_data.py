@@ -1,35 +1,41 @@
-import csv
-
-def convert_match_result(ht, at, FTR):
-    """Convert match result into the desired format."""
-    
-    if FTR == "H":
-        return f'("{ht}", "{at}", "win_a"),'
-    elif FTR == "A":
-        return f'("{ht}", "{at}", "win_b"),'
-    else:
-        return f'("{ht}", "{at}", "draw"),'
-
-def process_match_file(file_path):
-    """Process the match file and overwrite it with the formatted results."""
-    formatted_results = []
-    
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        next(reader)  # Skip header row if there is one
-        
-        for row in reader:
-            Div,Date,Time,HomeTeam,AwayTeam,FTHG,FTAG,FTR,HTHG,HTAG,HTR,HS,AS,HST,AST,HF,AF,HC,AC,HY,AY,HR,AR,B365H,B365D,B365A,BWH,BWD,BWA,IWH,IWD,IWA,PSH,PSD,PSA,WHH,WHD,WHA,VCH,VCD,VCA,MaxH,MaxD,MaxA,AvgH,AvgD,AvgA,B365a,B365at,pa,pb,Ma,Mb,Avga,Avgb,AHh,B365AHH,B365AHA,PAHH,PAHA,MaxAHH,MaxAHA,AvgAHH,AvgAHA,B365CH,B365CD,B365CA,BWCH,BWCD,BWCA,IWCH,IWCD,IWCA,PSCH,PSCD,PSCA,WHCH,WHCD,WHCA,VCCH,VCCD,VCCA,MaxCH,MaxCD,MaxCA,AvgCH,AvgCD,AvgCA,B365ca,B365cb,PCa,PCb,MaxCa,MaxCb,AvgCa,AvgCb,AHCh,B365CAHH,B365CAHA,PCAHH,PCAHA,MaxCAHH,MaxCAHA,AvgCAHH,AvgCAHA = row
-            formatted_result = convert_match_result(HomeTeam, AwayTeam, FTR)
-            formatted_results.append(formatted_result)
-    
-    # Overwrite the original file with the formatted results
-    with open(file_path, 'w') as file:
-        for result in formatted_results:
-            file.write(result + '\n')
-
-# Path to your file
-file_path = "Spanish data 2022.txt"
-
-# Process the file
-process_match_file(file_path)
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from match_dataset import dataset_path, read_match_csv, save_dataset, write_match_file
+
+def process_match_file(file_path, output_path=None):
+    """Convert a football-data CSV into a tuple match file and a .npy match array, keeping the CSV.
+
+    The tuple file (output_path, by default the CSV name with a .txt
+    extension) keeps the format the other tools read. The .npy file next to
+    it also keeps dates, goals and bookmaker odds.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(file_path)[0] + ".txt"
+    if os.path.abspath(output_path) == os.path.abspath(file_path):
+        raise ValueError(f"Output {output_path} would overwrite the input file.")
+
+    dataset = read_match_csv(file_path)
+    write_match_file(output_path, dataset)
+    save_dataset(dataset_path(output_path), dataset)
+    return len(dataset)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert football-data CSV files into match files.")
+    parser.add_argument("csv_files", nargs="+", help="CSV files, e.g. \"Spanish data 2024.csv\"")
+    parser.add_argument("--output", help="Tuple match file to write (only with a single CSV file)")
+    args = parser.parse_args()
+
+    if args.output and len(args.csv_files) > 1:
+        parser.error("--output can only be used with a single CSV file")
+
+    for csv_file in args.csv_files:
+        try:
+            count = process_match_file(csv_file, args.output)
+        except ValueError as error:
+            print(f"Could not convert {csv_file}: {error}")
+            continue
+        print(f"Converted {count} matches from {csv_file}")
@@ -0,0 +1,135 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+from backtest import iter_features, load_match_source
+from optimize_weights import chronological, evaluate_weight_grid, optimize_weight
+from rating_core import ModelParams
+
+FEATURES = ("expected_elo", "form_a", "form_b", "outcomes")
+PARAM_TYPES = {field.name: field.type for field in fields(ModelParams)}
+
+
+def parameter_grid(space, base=None):
+    """Yield ModelParams for every combination of {name: [values]}, in a deterministic order."""
+    base = base if base is not None else ModelParams()
+    names = list(space)
+    for values in product(*(space[name] for name in names)):
+        yield ModelParams(**{**asdict(base), **dict(zip(names, values))})
+
+
+def params_key(params, metric, weight_elo):
+    """Stable string identifying a configuration and how it was scored in the results log."""
+    return json.dumps([asdict(params), metric, weight_elo], sort_keys=True)
+
+
+# Parse each match file once per process (each worker keeps its own copy)
+load_match_file = lru_cache(maxsize=None)(load_match_source)
+
+
+def evaluate_params(params, match_files, metric="log_loss", weight_elo=None):
+    """Replay the match files with one configuration and score its pre-match predictions.
+
+    Files are replayed as backtest.iter_features does, with one state per
+    league and season regression between a league's files. With weight_elo
+    None the Elo/form weighting is tuned for the configuration (see
+    optimize_weights.optimize_weight), otherwise the given weight is used.
+    """
+    file_features = [features for _, _, _, features, _ in iter_features(match_files, params, load=load_match_file)]
+    features = {name: np.concatenate([chunk[name] for chunk in file_features]) for name in FEATURES}
+    if weight_elo is None:
+        weight_elo, _ = optimize_weight(features, metric=metric, params=params)
+    metrics = evaluate_weight_grid(features, [weight_elo], params)
+    result = {name: float(values[0]) for name, values in metrics.items()}
+    result["weight_elo"] = float(weight_elo)
+    result["matches"] = len(features["outcomes"])
+    return result
+
+
+def _evaluate_task(task):
+    """Worker entry point for the process pool."""
+    params, match_files, metric, weight_elo = task
+    return evaluate_params(params, match_files, metric, weight_elo)
+
+
+def load_results(log_file):
+    """Load {params_key: record} from a results log, ignoring a partially written last line."""
+    results = {}
+    try:
+        with open(log_file, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = params_key(ModelParams(**record["params"]), record["metric"], record["fixed_weight_elo"])
+                results[key] = record
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def run_search(space, match_files, log_file="search_results.jsonl", metric="log_loss", weight_elo=None, workers=None):
+    """Evaluate every configuration of the search space in parallel and return all records.
+
+    Each finished configuration is appended to the JSON-lines log, and
+    configurations already in the log are not evaluated again, so an
+    interrupted search resumes where it stopped. Results do not depend on
+    the number of workers.
+    """
+    done = load_results(log_file)
+    pending = [params for params in parameter_grid(space) if params_key(params, metric, weight_elo) not in done]
+    tasks = [(params, tuple(match_files), metric, weight_elo) for params in pending]
+
+    if tasks:
+        chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(log_file, 'a') as log:
+            for params, metrics in zip(pending, executor.map(_evaluate_task, tasks, chunksize=chunksize)):
+                record = {"params": asdict(params), "metric": metric, "fixed_weight_elo": weight_elo, **metrics}
+                log.write(json.dumps(record, sort_keys=True) + '\n')
+                log.flush()
+                done[params_key(params, metric, weight_elo)] = record
+
+    return [done[params_key(params, metric, weight_elo)] for params in parameter_grid(space)]
+
+
+def parse_space(specs):
+    """Parse ["k_factor=20,30,40", ...] into {name: [values]} with each field's type."""
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in PARAM_TYPES or not values:
+            raise ValueError(f"Invalid parameter {spec!r}; expected one of {', '.join(PARAM_TYPES)} as name=v1,v2")
+        cast = PARAM_TYPES[name] if PARAM_TYPES[name] in (int, str) else float
+        space[name] = [cast(value) for value in values.split(",")]
+    return space
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search model parameters with full season replays.")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Values to try for a ModelParams field (repeatable)")
+    parser.add_argument("--match-files", nargs="*", help="Match files (default: data/*.txt in chronological order)")
+    parser.add_argument("--metric", choices=["log_loss", "brier", "accuracy"], default="log_loss")
+    parser.add_argument("--weight-elo", type=float, help="Fixed Elo weight instead of tuning it per configuration")
+    parser.add_argument("--log", default="search_results.jsonl", help="Results log used to resume searches")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    space = parse_space(args.param) or {"k_factor": [30]}
+    match_files = chronological(args.match_files or glob.glob(os.path.join("data", "*.txt")))
+    records = run_search(space, match_files, log_file=args.log, metric=args.metric,
+                         weight_elo=args.weight_elo, workers=args.workers)
+
+    best = max(records, key=lambda record: record[args.metric] if args.metric == "accuracy" else -record[args.metric])
+    print(f"Evaluated {len(records)} configurations on {best['matches']} matches.")
+    print(f"Best {args.metric}: {best[args.metric]:.4f} with Elo weight {best['weight_elo']:.4f}")
+    for name, value in best["params"].items():
+        print(f"  {name} = {value}")
@@ -0,0 +1,192 @@
+import argparse
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from binary_store import array_to_state, load_binary, save_binary
+from match_dataset import has_dates, load_matches
+from optimize_weights import chronological
+from rating_core import (ModelParams, format_elo_lines, format_form_lines, get_store, load_elo_file,
+                         load_form_file, write_atomic)
+from replay_engine import ReplayEngine
+
+STATE_DIR = "state"
+
+
+def league_of(match_file):
+    """League name of a match file, taken from the first word of its name (e.g. "English")."""
+    return os.path.basename(match_file).split()[0].split(".")[0]
+
+
+def season_of(match_file):
+    """Season of a match file, taken from the years in its name (e.g. "2021-2023" or "2022")."""
+    years = re.findall(r"(?:19|20)\d{2}", os.path.basename(match_file))
+    return "-".join(dict.fromkeys([years[0], years[-1]])) if years else os.path.splitext(os.path.basename(match_file))[0]
+
+
+def league_dir(league, state_dir=STATE_DIR):
+    """Directory holding one league's current state, season snapshots and ingest log."""
+    return os.path.join(state_dir, league)
+
+
+def league_files(league, state_dir=STATE_DIR, season=None):
+    """(elo_file, form_file) of a league's current state, or of one season's snapshot."""
+    directory = league_dir(league, state_dir)
+    if season is not None:
+        directory = os.path.join(directory, "seasons", season)
+    return os.path.join(directory, "teams.txt"), os.path.join(directory, "recent_form.txt")
+
+
+def league_state_file(league, state_dir=STATE_DIR, season=None):
+    """Binary state file (see binary_store) next to the text files of league_files."""
+    return os.path.join(os.path.dirname(league_files(league, state_dir, season)[0]), "state.npy")
+
+
+def get_league_store(league, state_dir=STATE_DIR):
+    """Shared TeamStore of a league's current state, for predict and the other tools."""
+    elo_file, form_file = league_files(league, state_dir)
+    return get_store(elo_file=elo_file, form_file=form_file)
+
+
+def load_ingested(league, state_dir=STATE_DIR):
+    """Match files already ingested into a league's state."""
+    try:
+        with open(os.path.join(league_dir(league, state_dir), "ingested.json"), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
+
+
+def load_league_state(league, state_dir=STATE_DIR):
+    """Read a league's (elo_ratings, recent_form_history) after its last ingested file, empty if it has none yet.
+
+    The state comes from the snapshot of the last ingested season rather
+    than the current files, since an interrupted write can leave those
+    ahead of the ingest log. Older state directories without snapshots fall
+    back to the current files.
+    """
+    ingested = load_ingested(league, state_dir)
+    if not ingested:
+        return {}, {}
+    elo_file, form_file = league_files(league, state_dir, season_of(ingested[-1]))
+    if not os.path.exists(elo_file):
+        elo_file, form_file = league_files(league, state_dir)
+    elo_ratings = load_elo_file(elo_file) if os.path.exists(elo_file) else {}
+    recent_form_history = load_form_file(form_file) if os.path.exists(form_file) else {}
+    return elo_ratings, recent_form_history
+
+
+def load_league_engine(league, state_dir=STATE_DIR, params=None):
+    """ReplayEngine holding a league's state after its last ingested file (see load_league_state).
+
+    The binary snapshot is used when there is one: it is memory-mapped and
+    keeps full-precision ratings, so nothing is parsed or rounded.
+    """
+    engine = ReplayEngine(params=params)
+    ingested = load_ingested(league, state_dir)
+    state_file = league_state_file(league, state_dir, season_of(ingested[-1])) if ingested else None
+    if state_file is not None and os.path.exists(state_file):
+        engine.load_array(load_binary(state_file))
+    else:
+        elo_ratings, recent_form_history = load_league_state(league, state_dir)
+        engine.load_state(recent_form_history, elo_ratings)
+    return engine
+
+
+def ingest_league(league, match_files, state_dir=STATE_DIR, params=None):
+    """Replay a league's new match files season by season, without writing anything.
+
+    Runs in a worker process. Ratings regress towards 1500 by
+    params.season_regression before every season after the first. Match
+    dates come from the files' .npy match arrays (see
+    match_dataset.load_matches), which dated decay needs. Returns
+    (league, {"state": ..., "seasons": {season: ...}, "ingested": [...]}),
+    where each state is a structured state array (see binary_store).
+    """
+    params = params if params is not None else ModelParams()
+    engine = load_league_engine(league, state_dir, params)
+
+    ingested = load_ingested(league, state_dir)
+    seasons = {}
+    for match_file in match_files:
+        if os.path.basename(match_file) in ingested:
+            continue
+        matches, _ = load_matches(match_file)
+        if engine.dated_decay and not has_dates(matches):
+            raise ValueError(f"{match_file} has no match dates, which form_half_life_days needs; "
+                             "use the .npy match arrays written by data/convert_data.py.")
+        if engine.has_elo.any():
+            engine.regress_ratings()
+        engine.replay(matches)
+        seasons[season_of(match_file)] = engine.to_array()
+        ingested.append(os.path.basename(match_file))
+    return league, {"state": engine.to_array(), "seasons": seasons, "ingested": ingested}
+
+
+def _ingest_task(task):
+    """Worker entry point for the process pool."""
+    return ingest_league(*task)
+
+
+def write_state(league, state, state_dir=STATE_DIR, season=None):
+    """Write a state array as a league's text Elo and form files and its binary state file."""
+    elo_ratings, recent_form_history = array_to_state(state)
+    elo_file, form_file = league_files(league, state_dir, season)
+    write_atomic(elo_file, format_elo_lines(elo_ratings))
+    write_atomic(form_file, format_form_lines(recent_form_history))
+    save_binary(league_state_file(league, state_dir, season), state)
+
+
+def write_league_result(league, result, state_dir=STATE_DIR):
+    """Write a league's season snapshots, then its current state and ingest log, each file atomically.
+
+    The ingest log is written last and the next run starts from the
+    snapshot of the last season it lists (see load_league_state), so an
+    interrupted write is redone from a consistent state instead of being
+    skipped or applied twice.
+    """
+    for season, state in result["seasons"].items():
+        os.makedirs(os.path.dirname(league_state_file(league, state_dir, season)), exist_ok=True)
+        write_state(league, state, state_dir, season)
+    if not result["seasons"]:
+        return
+    write_state(league, result["state"], state_dir)
+    write_atomic(os.path.join(league_dir(league, state_dir), "ingested.json"), [json.dumps(result["ingested"], indent=2) + '\n'])
+
+
+def ingest_leagues(match_files, state_dir=STATE_DIR, params=None, workers=None):
+    """Ingest match files into per-league state, one worker process per league.
+
+    Files are grouped by league and replayed in the given (chronological)
+    order; leagues never share teams or state. Returns {league: number of
+    seasons ingested}.
+    """
+    by_league = {}
+    for match_file in match_files:
+        by_league.setdefault(league_of(match_file), []).append(match_file)
+    tasks = [(league, files, state_dir, params) for league, files in by_league.items()]
+
+    ingested = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for league, result in executor.map(_ingest_task, tasks):
+            os.makedirs(league_dir(league, state_dir), exist_ok=True)
+            write_league_result(league, result, state_dir)
+            ingested[league] = len(result["seasons"])
+    return ingested
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest match files into per-league state in parallel.")
+    parser.add_argument("match_files", nargs="*", help="Match files (default: data/*.txt)")
+    parser.add_argument("--state-dir", default=STATE_DIR)
+    parser.add_argument("--season-regression", type=float, default=0.0,
+                        help="Fraction of each rating's distance from 1500 removed between seasons")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    match_files = chronological(args.match_files or glob.glob(os.path.join("data", "*.txt")))
+    params = ModelParams(season_regression=args.season_regression)
+    for league, count in ingest_leagues(match_files, args.state_dir, params, args.workers).items():
+        print(f"{league}: {count} new seasons ingested into {league_dir(league, args.state_dir)}")
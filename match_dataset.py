@@ -0,0 +1,152 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from binary_store import load_binary, save_binary
+from match_parser import FTR_RESULTS, RESULT_CODES, RESULTS, MatchParseError, iter_csv_rows, iter_matches
+from rating_core import write_atomic
+
+# Bookmaker odds kept from football-data files, as (home, draw, away) columns
+ODDS_SOURCES = {
+    "average": ("AvgH", "AvgD", "AvgA"),
+    "pinnacle": ("PSH", "PSD", "PSA"),
+    "b365": ("B365H", "B365D", "B365A"),
+    "average_closing": ("AvgCH", "AvgCD", "AvgCA"),
+    "pinnacle_closing": ("PSCH", "PSCD", "PSCA"),
+    "b365_closing": ("B365CH", "B365CD", "B365CA"),
+}
+
+REQUIRED_COLUMNS = ("HomeTeam", "AwayTeam", "FTR")
+OPTIONAL_COLUMNS = ("Date", "FTHG", "FTAG") + tuple(column for columns in ODDS_SOURCES.values() for column in columns)
+
+DATE_FORMATS = ("%d/%m/%Y", "%d/%m/%y")
+
+
+def match_dtype(name_length):
+    """Structured dtype of one match: date, teams, goals (-1 if unknown), result code and odds (NaN if unknown)."""
+    return np.dtype([
+        ("date", "datetime64[D]"),
+        ("team_a", f"U{max(name_length, 1)}"),
+        ("team_b", f"U{max(name_length, 1)}"),
+        ("goals_a", "i2"),
+        ("goals_b", "i2"),
+        ("result", "i1"),
+        *((f"odds_{source}", "f8", (3,)) for source in ODDS_SOURCES),
+    ])
+
+
+def parse_date(value):
+    """Parse a football-data date (dd/mm/yyyy or dd/mm/yy); empty values become NaT."""
+    if not value:
+        return np.datetime64("NaT")
+    for date_format in DATE_FORMATS:
+        try:
+            return np.datetime64(datetime.strptime(value, date_format).date())
+        except ValueError:
+            continue
+    raise ValueError(f"unknown date format {value!r}")
+
+
+def parse_number(value, missing):
+    """Parse a numeric CSV field, using `missing` for empty fields."""
+    return float(value) if value else missing
+
+
+def read_match_csv(file_path):
+    """Read a football-data CSV into a structured match array, parsing only the kept columns."""
+    columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    records = []
+    for line_number, values in iter_csv_rows(file_path, columns, optional=OPTIONAL_COLUMNS):
+        row = dict(zip(columns, values))
+        result = FTR_RESULTS.get(row["FTR"])
+        if result is None or not row["HomeTeam"] or not row["AwayTeam"]:
+            raise MatchParseError(line_number, ','.join(values), "invalid match row")
+        try:
+            records.append((
+                parse_date(row["Date"]),
+                row["HomeTeam"],
+                row["AwayTeam"],
+                int(parse_number(row["FTHG"], -1)),
+                int(parse_number(row["FTAG"], -1)),
+                RESULT_CODES[result],
+                *(tuple(parse_number(row[column], np.nan) for column in odds) for odds in ODDS_SOURCES.values()),
+            ))
+        except ValueError as error:
+            raise MatchParseError(line_number, ','.join(values), str(error)) from None
+
+    name_length = max((max(len(record[1]), len(record[2])) for record in records), default=1)
+    return np.array(records, dtype=match_dtype(name_length))
+
+
+def implied_probabilities(odds):
+    """Convert (matches, 3) decimal odds into probabilities with the bookmaker margin removed (NaN if unknown)."""
+    inverse = 1 / np.asarray(odds, dtype=float)
+    return inverse / inverse.sum(axis=1, keepdims=True)
+
+
+def market_probabilities(dataset, sources=tuple(ODDS_SOURCES)):
+    """Implied (win_a, draw, win_b) probabilities per match from the first odds source that has prices."""
+    probabilities = np.full((len(dataset), 3), np.nan)
+    for source in sources:
+        missing = np.isnan(probabilities).any(axis=1)
+        if not missing.any():
+            break
+        probabilities[missing] = implied_probabilities(dataset[f"odds_{source}"][missing])
+    return probabilities
+
+
+def dataset_matches(dataset, dates=False):
+    """(team_a, team_b, result) tuples of a match array, in order.
+
+    With dates, each tuple also holds the match date (a datetime.date, or
+    None if unknown), as FormRatingSystem.update_match takes it.
+    """
+    columns = [dataset["team_a"].tolist(), dataset["team_b"].tolist(), (RESULTS[code] for code in dataset["result"].tolist())]
+    if dates:
+        columns.append(dataset["date"].tolist())
+    return list(zip(*columns))
+
+
+def has_dates(matches):
+    """Whether any (team_a, team_b, result[, match_date]) match has a date."""
+    return any(len(match) > 3 and match[3] is not None for match in matches)
+
+
+def save_dataset(file_path, dataset):
+    """Save a match array as a .npy file atomically."""
+    save_binary(file_path, dataset)
+
+
+def load_dataset(file_path, mmap=True):
+    """Load a match array, memory-mapped by default."""
+    return load_binary(file_path, mmap=mmap)
+
+
+def dataset_path(match_file):
+    """Path of the .npy match array that sits next to a tuple match file."""
+    return os.path.splitext(match_file)[0] + ".npy"
+
+
+def load_matches(match_file):
+    """Load (matches, match array or None) from a tuple match file or a .npy match array.
+
+    Matches come with their dates from the match array, which for a tuple
+    file is the .npy array written next to it by data/convert_data.py when
+    it holds the same matches. Otherwise they are undated (team_a, team_b,
+    result) tuples.
+    """
+    if match_file.endswith(".npy"):
+        dataset = load_dataset(match_file)
+        return dataset_matches(dataset, dates=True), dataset
+    matches = list(iter_matches(match_file))
+    if os.path.exists(dataset_path(match_file)):
+        dataset = load_dataset(dataset_path(match_file))
+        if dataset_matches(dataset) == matches:
+            return dataset_matches(dataset, dates=True), dataset
+    return matches, None
+
+
+def write_match_file(file_path, dataset):
+    """Write a match array as a ("A", "B", "result") tuple file."""
+    write_atomic(file_path, [f'("{team_a}", "{team_b}", "{result}"),\n' for team_a, team_b, result in dataset_matches(dataset)])
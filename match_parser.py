@@ -0,0 +1,151 @@
+import csv
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+Match = namedtuple("Match", ["team_a", "team_b", "result"])
+Fixture = namedtuple("Fixture", ["team_a", "team_b"])
+
+RESULTS = ("win_a", "draw", "win_b")
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}  # Integer codes used in match arrays
+
+# Full-time result codes used by football-data CSV files
+FTR_RESULTS = {"H": "win_a", "D": "draw", "A": "win_b"}
+
+# Matches ("Team A", "Team B", "result") with an optional trailing comma
+MATCH_LINE = re.compile(r"""\(\s*(["'])(.+?)\1\s*,\s*(["'])(.+?)\3\s*,\s*(["'])(\w+)\5\s*\)\s*,?""")
+
+# Matches ("Team A", "Team B") or ("Team A", "Team B", "result") for fixture lists
+FIXTURE_LINE = re.compile(r"""\(\s*(["'])(.+?)\1\s*,\s*(["'])(.+?)\3\s*(?:,\s*(["'])(\w+)\5\s*)?\)\s*,?""")
+
+
+class MatchParseError(ValueError):
+    def __init__(self, line_number, line, reason):
+        """Error for a line that cannot be parsed, keeping its line number for reporting."""
+        self.line_number = line_number
+        self.line = line
+        self.reason = reason
+        super().__init__(f"Line {line_number}: {reason}: {line!r}")
+
+
+@contextmanager
+def open_source(source, **open_kwargs):
+    """Open a path for reading, or pass an already open file through unchanged."""
+    if hasattr(source, "read"):
+        yield source
+    else:
+        with open(source, 'r', **open_kwargs) as file:
+            yield file
+
+
+def parse_match_line(line, line_number=None):
+    """Parse one ("A", "B", "result") line into a Match, or None for a blank line."""
+    line = line.strip()
+    if not line:
+        return None
+    parsed = MATCH_LINE.fullmatch(line)
+    if parsed is None:
+        raise MatchParseError(line_number, line, "invalid match format")
+    result = parsed.group(6)
+    if result not in RESULTS:
+        raise MatchParseError(line_number, line, f"unknown result {result!r}")
+    return Match(parsed.group(2).strip(), parsed.group(4).strip(), result)
+
+
+def iter_numbered_matches(source, strict=True, verbose=False, start_line=0, errors=None):
+    """Stream (line_number, Match) pairs from a match file in the tuple format.
+
+    Lines up to and including start_line are skipped. Invalid lines raise
+    MatchParseError when strict, otherwise they are skipped (reported when
+    verbose, and their errors appended to the `errors` list if given).
+    """
+    with open_source(source) as file:
+        for line_number, line in enumerate(file, start=1):
+            if line_number <= start_line:
+                continue
+            try:
+                match = parse_match_line(line, line_number)
+            except MatchParseError as error:
+                if strict:
+                    raise
+                if errors is not None:
+                    errors.append(error)
+                if verbose:
+                    print(f"Skipping invalid line: {error}")
+                continue
+            if match is None:
+                continue
+            if verbose:
+                print(f"Parsed match: {match.team_a} vs {match.team_b} - Result: {match.result}")
+            yield line_number, match
+
+
+def iter_matches(source, strict=True, verbose=False):
+    """Stream Match records from a match file in the tuple format."""
+    for _, match in iter_numbered_matches(source, strict=strict, verbose=verbose):
+        yield match
+
+
+def parse_fixture_line(line, line_number=None):
+    """Parse one ("A", "B") or ("A", "B", "result") line into a Fixture, or None for a blank line."""
+    line = line.strip()
+    if not line:
+        return None
+    parsed = FIXTURE_LINE.fullmatch(line)
+    if parsed is None:
+        raise MatchParseError(line_number, line, "invalid fixture format")
+    return Fixture(parsed.group(2).strip(), parsed.group(4).strip())
+
+
+def iter_numbered_fixtures(source, strict=True, verbose=False):
+    """Stream (line_number, Fixture) pairs from a fixture file; any result field is ignored."""
+    with open_source(source) as file:
+        for line_number, line in enumerate(file, start=1):
+            try:
+                fixture = parse_fixture_line(line, line_number)
+            except MatchParseError as error:
+                if strict:
+                    raise
+                if verbose:
+                    print(f"Skipping invalid line: {error}")
+                continue
+            if fixture is not None:
+                yield line_number, fixture
+
+
+def iter_csv_rows(source, columns, optional=()):
+    """Stream (line_number, values) for selected columns of a CSV file with a header row.
+
+    Only the requested columns are extracted; rows where all of them are
+    empty (football-data files often end with such rows) are skipped.
+    Columns listed in optional may be absent from the file and read as "".
+    """
+    with open_source(source, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [column for column in columns if column not in header and column not in optional]
+        if missing:
+            raise MatchParseError(1, ','.join(header), f"missing columns {', '.join(missing)}")
+        indices = [header.index(column) if column in header else None for column in columns]
+        last_index = max((index for index in indices if index is not None), default=-1)
+        for row in reader:
+            if len(row) <= last_index:
+                if any(row):
+                    raise MatchParseError(reader.line_num, ','.join(row), "too few columns")
+                continue
+            values = tuple(row[index].strip() if index is not None else "" for index in indices)
+            if any(values):
+                yield reader.line_num, values
+
+
+def iter_csv_matches(source, verbose=False):
+    """Stream Match records from a football-data CSV file (HomeTeam, AwayTeam, FTR)."""
+    for line_number, (home_team, away_team, ftr) in iter_csv_rows(source, ("HomeTeam", "AwayTeam", "FTR")):
+        result = FTR_RESULTS.get(ftr)
+        if result is None or not home_team or not away_team:
+            raise MatchParseError(line_number, f"{home_team},{away_team},{ftr}", "invalid match row")
+        if verbose:
+            print(f"Parsed match: {home_team} vs {away_team} - Result: {result}")
+        yield Match(home_team, away_team, result)
@@ -1,63 +1,36 @@
+import argparse
+import glob
+import os
+import re
+
 import numpy as np
-from itertools import product
-
-class EloRatingSystem:
-    def __init__(self, k_factor=30, file_path="teams.txt"):
-        """Initialize Elo rating system with a K-factor and file path for team ratings."""
-        self.k_factor = k_factor
-        self.ratings = {}
-        self.file_path = file_path
-        self.load_ratings()
-
-    def load_ratings(self):
-        """Load team ratings and matches played from a text file."""
-        try:
-            with open(self.file_path, 'r') as file:
-                for line in file:
-                    line = line.strip()
-                    if line:
-                        *team_parts, rating, matches_played = line.split()
-                        team = ' '.join(team_parts)
-                        self.ratings[team] = [float(rating), int(matches_played)]
-        except FileNotFoundError:
-            print(f"File {self.file_path} not found. Please create it with team ratings.")
-
-    def get_rating(self, team):
-        """Get rating and matches played for a team."""
-        if team not in self.ratings:
-            self.ratings[team] = [1500, 0]
-        return self.ratings[team]
-
-    def expected_score(self, team_a, team_b):
-        """Calculate the expected score for two teams based on their ratings."""
-        rating_a = self.get_rating(team_a)[0]
-        rating_b = self.get_rating(team_b)[0]
-        expected_a = 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
-        expected_b = 1 - expected_a
-        return expected_a, expected_b
+
+from match_parser import RESULT_CODES, iter_matches
+from prediction_cache import get_prediction_cache
+from rating_core import EloRatingSystem, ModelParams, draw_adjusted_probabilities, form_mean, get_store
+from replay_engine import ReplayEngine
 
 def load_recent_form(file_path):
-    """Load recent form data from a file."""
-    recent_form = {}
-    with open(file_path, 'r') as file:
-        for line in file:
-            parts = line.strip().split()
-            recent_form_value = float(parts[0])  # The first value is the recent form value
-            team_name = ' '.join(parts[1:-6])    # Join everything from the second element up to the last 6 as team name
-            form_scores = list(map(float, parts[-6:]))  # The last 6 values are the form scores
-            recent_form[team_name] = form_scores
-    return recent_form
+    """Load recent form data {team: form_scores} from a file through the shared store."""
+    store = get_store(form_file=file_path)
+    return {team: form_history for team, (_, form_history) in store.recent_form_history.items()}
 
 
 def predict_weighted_outcome(team_a, team_b, elo_system, recent_form, weight_elo, weight_form):
-    """Predict the match outcome using a weighted combination of Elo rating and recent form."""
-    
+    """Predict the match outcome using a weighted combination of Elo rating and recent form.
+
+    With recent_form None, the form means of the Elo system's store are
+    used and the result is cached until either team changes.
+    """
+    if recent_form is None:
+        return get_prediction_cache(elo_system).weighted_outcome(team_a, team_b, weight_elo, weight_form)
+
     # Get Elo rating-based expected score
     expected_a_elo, expected_b_elo = elo_system.expected_score(team_a, team_b)
     
     # Get recent form-based expected score
-    form_a = np.mean(recent_form.get(team_a, [0] * 6))  # Average recent form score of team_a
-    form_b = np.mean(recent_form.get(team_b, [0] * 6))  # Average recent form score of team_b
+    form_a = form_mean(recent_form.get(team_a, []))  # Average recent form score of team_a
+    form_b = form_mean(recent_form.get(team_b, []))  # Average recent form score of team_b
     total_form = form_a + form_b if form_a + form_b != 0 else 1  # Avoid division by zero
     
     expected_a_form = form_a / total_form
@@ -70,7 +43,7 @@ def predict_weighted_outcome(team_a, team_b, elo_system, recent_form, weight_elo
     return expected_a, expected_b
 
 def evaluate_accuracy(elo_system, recent_form, match_results, weight_elo, weight_form):
-    """Evaluate the accuracy of predictions with a given weighting."""
+    """Evaluate the accuracy of predictions with a given weighting (recent_form None uses the store's form means)."""
     correct_predictions = 0
     total_matches = 0
 
@@ -91,42 +64,205 @@ def evaluate_accuracy(elo_system, recent_form, match_results, weight_elo, weight
     
     return correct_predictions / total_matches  # Return accuracy
 
-def find_best_weights(elo_system, recent_form, match_results):
+
+def static_match_features(elo_system, recent_form, match_results):
+    """Precompute Elo expectations, form means and outcomes for matches against fixed state."""
+    expected_elo = np.array([elo_system.expected_score(team_a, team_b)[0] for team_a, team_b, _ in match_results])
+    form_means = {team: float(np.mean(form)) if form else 0.0 for team, form in recent_form.items()}
+    form_a = np.array([form_means.get(team_a, 0.0) for team_a, _, _ in match_results])
+    form_b = np.array([form_means.get(team_b, 0.0) for _, team_b, _ in match_results])
+    outcomes = np.array([RESULT_CODES.get(result, RESULT_CODES["draw"]) for _, _, result in match_results], dtype=np.int64)
+    return {"expected_elo": expected_elo, "form_a": form_a, "form_b": form_b, "outcomes": outcomes}
+
+
+def walk_forward_features(matches, engine=None):
+    """Replay matches in order and record each match's features from the state before it is played."""
+    engine = engine if engine is not None else ReplayEngine()
+    matches = list(matches)
+    ids_a, ids_b, outcomes = engine.encode_matches(matches)
+    trace = engine.trace_encoded(ids_a, ids_b, outcomes, engine.encode_days(matches) if engine.dated_decay else None)
+    return {"expected_elo": trace["expected_a"], "form_a": trace["form_mean_a"], "form_b": trace["form_mean_b"],
+            "outcomes": outcomes}
+
+
+def slice_features(features, start, stop):
+    """Select a contiguous range of matches from a features dictionary."""
+    return {name: values[start:stop] for name, values in features.items()}
+
+
+def weighted_expectations(features, weights_elo):
+    """Vectorized predict_weighted_outcome: (expected_a, expected_b) with one row per Elo weight."""
+    weights_elo = np.asarray(weights_elo, dtype=float)[:, None]
+    form_a = features["form_a"]
+    form_b = features["form_b"]
+    total_form = form_a + form_b
+    total_form = np.where(total_form != 0, total_form, 1)  # Avoid division by zero
+    expected_elo = features["expected_elo"]
+    expected_a = weights_elo * expected_elo + (1 - weights_elo) * (form_a / total_form)
+    expected_b = weights_elo * (1 - expected_elo) + (1 - weights_elo) * (form_b / total_form)
+    return expected_a, expected_b
+
+
+def outcome_probabilities(expected_a, expected_b, params=None):
+    """Stack (win_a, draw, win_b) probabilities along a new first axis from weighted expectations.
+
+    Form expectations are not bounded, so probabilities are clipped and
+    renormalized to stay a valid distribution.
+    """
+    params = params if params is not None else ModelParams()
+    probabilities = np.stack(draw_adjusted_probabilities(expected_a, expected_b, params.max_draw_prob, params.min_draw_prob))
+    probabilities = np.clip(probabilities, 1e-6, None)
+    return probabilities / probabilities.sum(axis=0)
+
+
+def evaluate_weight_grid(features, weights_elo, params=None, chunk_size=2_000_000):
+    """Evaluate accuracy, log-loss and Brier score for every Elo weight (form weight is 1 - Elo weight).
+
+    Weights are processed in chunks so memory stays bounded for long
+    histories and fine grids.
+    """
+    weights_elo = np.asarray(weights_elo, dtype=float)
+    params = params if params is not None else ModelParams()
+    outcomes = features["outcomes"]
+    match_count = len(outcomes)
+    metrics = {name: np.zeros(len(weights_elo)) for name in ("accuracy", "log_loss", "brier")}
+    if not match_count:
+        return metrics
+
+    rows_per_chunk = max(1, chunk_size // match_count)
+    one_hot = np.eye(3)[outcomes].T
+    for start in range(0, len(weights_elo), rows_per_chunk):
+        stop = start + rows_per_chunk
+        expected_a, expected_b = weighted_expectations(features, weights_elo[start:stop])
+
+        # Accuracy uses the original rule: the larger expectation wins, ties are draws
+        predicted = np.where(expected_a > expected_b, 0, np.where(expected_b > expected_a, 2, 1))
+        metrics["accuracy"][start:stop] = (predicted == outcomes).mean(axis=1)
+
+        probabilities = outcome_probabilities(expected_a, expected_b, params)
+        actual = np.take_along_axis(probabilities, outcomes[None, None, :], axis=0)[0]
+        metrics["log_loss"][start:stop] = -np.log(actual).mean(axis=1)
+        metrics["brier"][start:stop] = ((probabilities - one_hot[:, None, :]) ** 2).sum(axis=0).mean(axis=1)
+    return metrics
+
+
+def optimize_weight(features, metric="log_loss", grid_size=101, tolerance=1e-6, params=None):
+    """Find the Elo weight that optimizes a metric; returns (weight_elo, metric_value).
+
+    A vectorized grid search locates the best region, then log-loss and Brier
+    score are refined continuously with a golden-section search between the
+    neighbouring grid points. Accuracy is piecewise constant, so it only uses
+    the grid.
+    """
+    maximize = metric == "accuracy"
+    grid = np.linspace(0, 1, grid_size)
+    values = evaluate_weight_grid(features, grid, params)[metric]
+    best = int(np.argmax(values) if maximize else np.argmin(values))
+    if maximize:
+        return float(grid[best]), float(values[best])
+
+    def loss(weight):
+        return evaluate_weight_grid(features, [weight], params)[metric][0]
+
+    low, high = grid[max(best - 1, 0)], grid[min(best + 1, grid_size - 1)]
+    ratio = (np.sqrt(5) - 1) / 2
+    left, right = high - ratio * (high - low), low + ratio * (high - low)
+    loss_left, loss_right = loss(left), loss(right)
+    while high - low > tolerance:
+        if loss_left < loss_right:
+            high, right, loss_right = right, left, loss_left
+            left = high - ratio * (high - low)
+            loss_left = loss(left)
+        else:
+            low, left, loss_left = left, right, loss_right
+            right = low + ratio * (high - low)
+            loss_right = loss(right)
+    weight = (low + high) / 2
+    candidates = [(loss(weight), weight), (float(values[best]), float(grid[best]))]
+    value, weight = min(candidates)
+    return float(weight), float(value)
+
+
+def walk_forward(match_files, metric="log_loss", grid_size=101):
+    """Tune the Elo weight on all earlier match files and score it on the next one.
+
+    Files are replayed once in the given (chronological) order; each match's
+    features come from the state before it was played. Returns one result
+    dictionary per evaluated file.
+    """
+    matches = []
+    boundaries = [0]
+    for match_file in match_files:
+        matches.extend(iter_matches(match_file))
+        boundaries.append(len(matches))
+    features = walk_forward_features(matches)
+
+    results = []
+    for index in range(1, len(match_files)):
+        train = slice_features(features, 0, boundaries[index])
+        test = slice_features(features, boundaries[index], boundaries[index + 1])
+        weight_elo, train_value = optimize_weight(train, metric=metric, grid_size=grid_size)
+        test_metrics = evaluate_weight_grid(test, [weight_elo])
+        results.append({
+            "file": match_files[index],
+            "weight_elo": weight_elo,
+            "weight_form": 1 - weight_elo,
+            f"train_{metric}": train_value,
+            **{name: float(values[0]) for name, values in test_metrics.items()},
+        })
+    return results
+
+
+def chronological(match_files):
+    """Sort match files by the first year in their name (e.g. "Spanish data 2022.txt")."""
+    def first_year(match_file):
+        years = re.findall(r"(?:19|20)\d{2}", os.path.basename(match_file))
+        return (int(years[0]) if years else 0, match_file)
+    return sorted(match_files, key=first_year)
+
+
+def find_best_weights(elo_system, recent_form, match_results, grid_size=11):
     """Find the best combination of Elo and form weights."""
-    best_accuracy = 0
-    best_weights = (0, 0)
+    # Weights are generated so that they always sum to exactly 1
+    weights_elo = np.linspace(0, 1, grid_size)
+    accuracy = evaluate_weight_grid(static_match_features(elo_system, recent_form, match_results), weights_elo)["accuracy"]
+    best = int(np.argmax(accuracy))
+    best_weights = (float(weights_elo[best]), float(1 - weights_elo[best]))
+    return best_weights, float(accuracy[best])
 
-    # Try different combinations of weights
-    weight_combinations = product(np.arange(0, 1.1, 0.1), repeat=2)  # Try weights from 0.0 to 1.0
-    
-    for weight_elo, weight_form in weight_combinations:
-        if weight_elo + weight_form == 1:  # Ensure that weights sum to 1
-            accuracy = evaluate_accuracy(elo_system, recent_form, match_results, weight_elo, weight_form)
-            if accuracy > best_accuracy:
-                best_accuracy = accuracy
-                best_weights = (weight_elo, weight_form)
-    
-    return best_weights, best_accuracy
-
-# Main process
-elo_system = EloRatingSystem(file_path="teams.txt")
-recent_form = load_recent_form("recent_form.txt")
-
-# Example match results (team_a, team_b, result)
-match_results = [
-    ("Crystal Palace", "Liverpool", "win_b"),
-    ("Arsenal", "Southampton", "win_a"),
-    ("Brentford", "Wolves", "win_a"),
-    ("Man City", "Fulham", "win_a"),
-    ("West Ham", "Ipswich", "win_a"),
-    ("Leicester City", "Bournemouth", "win_a"),
-    ("Everton", "Newcastle", "draw"),
-    ("Aston Villa", "Man United", "draw"),
-    ("Chelsea", "Nottingham Forest", "draw"),
-    ("Brighton", "Tottenham", "win_a"),
-]
-
-# Find the best weights
-best_weights, best_accuracy = find_best_weights(elo_system, recent_form, match_results)
-print(f"Best weights (Elo, Form): {best_weights}")
-print(f"Best accuracy: {best_accuracy:.2%}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the best weighting of Elo and recent form.")
+    parser.add_argument("--walk-forward", nargs="*", metavar="MATCH_FILE",
+                        help="Tune walk-forward over match files (default: data/*.txt in chronological order)")
+    parser.add_argument("--metric", choices=["log_loss", "brier", "accuracy"], default="log_loss")
+    parser.add_argument("--grid-size", type=int, default=101)
+    args = parser.parse_args()
+
+    if args.walk_forward is not None:
+        match_files = chronological(args.walk_forward or glob.glob("data/*.txt"))
+        for result in walk_forward(match_files, metric=args.metric, grid_size=args.grid_size):
+            print(f"{result['file']}: weights (Elo, Form) = ({result['weight_elo']:.4f}, {result['weight_form']:.4f}), "
+                  f"accuracy {result['accuracy']:.2%}, log-loss {result['log_loss']:.4f}, Brier {result['brier']:.4f}")
+    else:
+        # Main process
+        elo_system = EloRatingSystem(file_path="teams.txt")
+        recent_form = load_recent_form("recent_form.txt")
+
+        # Example match results (team_a, team_b, result)
+        match_results = [
+            ("Crystal Palace", "Liverpool", "win_b"),
+            ("Arsenal", "Southampton", "win_a"),
+            ("Brentford", "Wolves", "win_a"),
+            ("Man City", "Fulham", "win_a"),
+            ("West Ham", "Ipswich", "win_a"),
+            ("Leicester City", "Bournemouth", "win_a"),
+            ("Everton", "Newcastle", "draw"),
+            ("Aston Villa", "Man United", "draw"),
+            ("Chelsea", "Nottingham Forest", "draw"),
+            ("Brighton", "Tottenham", "win_a"),
+        ]
+
+        # Find the best weights
+        best_weights, best_accuracy = find_best_weights(elo_system, recent_form, match_results)
+        print(f"Best weights (Elo, Form): {best_weights}")
+        print(f"Best accuracy: {best_accuracy:.2%}")
@@ -1,73 +1,98 @@
-class EloRatingSystem:
-    def __init__(self, k_factor=30, file_path="teams.txt"):
-        """Initialize Elo rating system with a K-factor and file path for team ratings."""
-        self.k_factor = k_factor
-        self.ratings = {}
-        self.file_path = file_path
-        self.load_ratings()
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from binary_store import ArrayTeamStore
+from match_parser import MatchParseError, iter_numbered_fixtures
+from profiling import timed
+from rating_core import EloRatingSystem, draw_adjusted_probabilities, elo_expected_score
+
+OUTPUT_FIELDS = ["line", "team_a", "team_b", "win_a", "draw", "win_b", "missing"]
 
-    def load_ratings(self):
-        """Load team ratings and matches played from a text file."""
-        try:
-            with open(self.file_path, 'r') as file:
-                for line in file:
-                    line = line.strip()
-                    if line:
-                        # Split team name, rating, and matches played
-                        *team_parts, rating, matches_played = line.split()  # Split into components
-                        team = ' '.join(team_parts)  # Reconstruct team name from parts
-                        self.ratings[team] = [float(rating), int(matches_played)]
-        except FileNotFoundError:
-            print(f"File {self.file_path} not found. Please create it with team ratings.")
 
-    def get_rating(self, team):
-        """Get rating and matches played for a team. Initialize to 1500 and 0 matches if not present."""
-        if team not in self.ratings:
-            self.ratings[team] = [1500, 0]  # Default rating is 1500 with 0 matches played
-        return self.ratings[team]
+@timed("predict.predict_fixtures")
+def predict_fixtures(elo_system, fixtures):
+    """Predict win/draw/loss probabilities for many (team_a, team_b) fixtures in one vectorized pass.
 
-    def expected_score(self, team_a, team_b):
-        """Calculate the expected score for two teams based on their ratings."""
-        rating_a = self.get_rating(team_a)[0]  # Get team A's rating
-        rating_b = self.get_rating(team_b)[0]  # Get team B's rating
-        expected_a = 1 / (1 + 10 ** ((rating_b - rating_a) / 400))  # Expected score for team A
-        expected_b = 1 - expected_a  # Expected score for team B
-        return expected_a, expected_b
+    Returns one row per fixture, in order. Rows of fixtures with a team
+    missing from the ratings have None probabilities and list the missing
+    teams under "missing" instead of printing anything.
+    """
+    ratings = elo_system.ratings
+    params = elo_system.params
+    rows = []
+    known = []
+    rating_a = []
+    rating_b = []
+    for index, (team_a, team_b) in enumerate(fixtures):
+        missing = [team for team in (team_a, team_b) if team not in ratings]
+        rows.append({"team_a": team_a, "team_b": team_b, "win_a": None, "draw": None, "win_b": None, "missing": missing})
+        if not missing:
+            known.append(index)
+            rating_a.append(ratings[team_a][0])
+            rating_b.append(ratings[team_b][0])
 
-    def predict_match(self, team_a, team_b):
-        """Predict the outcome probabilities of a match between two teams."""
-        
-        # Check if both teams exist in the ratings
-        if team_a not in self.ratings or team_b not in self.ratings:
-            print(f"One or both teams ({team_a}, {team_b}) do not exist in the database.")
-            return None
-        
-        expected_a, expected_b = self.expected_score(team_a, team_b)
-        
-        # Calculate skill gap between the two teams
-        skill_gap = abs(expected_a - expected_b)
-        
-        # Adjust draw probability based on the skill gap
-        max_draw_prob = 0.3  # Maximum draw probability when teams are evenly matched
-        min_draw_prob = 0.05  # Minimum draw probability when there's a large skill gap
-        draw_prob = max_draw_prob - skill_gap * (max_draw_prob - min_draw_prob)
-        
-        # Adjust win probabilities with the dynamic draw probability
-        win_a_prob = expected_a * (1 - draw_prob)
-        win_b_prob = expected_b * (1 - draw_prob)
-        
-        return {"win_a": win_a_prob, "draw": draw_prob, "win_b": win_b_prob}
+    if known:
+        expected_a = elo_expected_score(np.array(rating_a), np.array(rating_b), params.elo_scale)
+        win_a, draw, win_b = draw_adjusted_probabilities(expected_a, 1 - expected_a,
+                                                         params.max_draw_prob, params.min_draw_prob)
+        for index, row_win_a, row_draw, row_win_b in zip(known, win_a.tolist(), draw.tolist(), win_b.tolist()):
+            rows[index].update(win_a=row_win_a, draw=row_draw, win_b=row_win_b)
+    return rows
 
 
-# Initialize the EloRatingSystem
-elo_system = EloRatingSystem()
+def write_predictions(rows, output, output_format="csv"):
+    """Write prediction rows as CSV (missing teams joined with ';') or as a JSON document."""
+    if output_format == "json":
+        missing = [{key: row[key] for key in ("line", "team_a", "team_b", "missing") if key in row}
+                   for row in rows if row["missing"]]
+        json.dump({"predictions": rows, "missing": missing}, output, indent=2)
+        output.write("\n")
+        return
+    writer = csv.DictWriter(output, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "missing": ";".join(row["missing"])})
 
-# Example: Predict the outcome of a match
-match_prediction = elo_system.predict_match("Crystal Palace", "Man United")
 
-# Only print predictions if both teams exist (i.e., match_prediction is not None)
-if match_prediction:
-    print("Predicted outcome probabilities:")
-    print(f"Home team win: {match_prediction['win_a']:.2%}")
-    print(f"Draw: {match_prediction['draw']:.2%}")
-    print(f"Away team win: {match_prediction['win_b']:.2%}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict match outcome probabilities.")
+    parser.add_argument("fixture_file", nargs="?",
+                        help="File of (\"A\", \"B\") fixtures, or - for stdin; without it an example match is predicted")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--state", help="Memory-mapped binary state file (.npy, see binary_store) instead of --elo-file")
+    args = parser.parse_args()
+
+    # Initialize the EloRatingSystem
+    if args.state:
+        elo_system = EloRatingSystem(file_path=args.state, store=ArrayTeamStore(args.state))
+    else:
+        elo_system = EloRatingSystem(file_path=args.elo_file)
+
+    if args.fixture_file:
+        source = sys.stdin if args.fixture_file == "-" else args.fixture_file
+        try:
+            numbered_fixtures = list(iter_numbered_fixtures(source))
+        except MatchParseError as error:
+            sys.exit(f"Invalid fixture file: {error}")
+        rows = predict_fixtures(elo_system, [fixture for _, fixture in numbered_fixtures])
+        for (line_number, _), row in zip(numbered_fixtures, rows):
+            row["line"] = line_number
+        write_predictions(rows, sys.stdout, args.format)
+        missing_count = sum(1 for row in rows if row["missing"])
+        if missing_count:
+            print(f"{missing_count} fixtures have teams missing from the ratings.", file=sys.stderr)
+    else:
+        # Example: Predict the outcome of a match
+        match_prediction = elo_system.predict_match("Crystal Palace", "Man United")
+
+        # Only print predictions if both teams exist (i.e., match_prediction is not None)
+        if match_prediction:
+            print("Predicted outcome probabilities:")
+            print(f"Home team win: {match_prediction['win_a']:.2%}")
+            print(f"Draw: {match_prediction['draw']:.2%}")
+            print(f"Away team win: {match_prediction['win_b']:.2%}")
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+
+from predict import predict_fixtures
+
+
+class PredictionCache:
+    def __init__(self, elo_system, maxsize=4096):
+        """LRU cache of predictions for one EloRatingSystem, checked against its store's team versions.
+
+        Each entry remembers the versions of its two teams when it was
+        computed, so an update to a team only invalidates the pairs that
+        involve it, and nothing has to be scanned or cleared.
+        """
+        self.elo_system = elo_system
+        self.store = elo_system.store
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # (team_a, team_b, kind) -> ((version_a, version_b), value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, team_a, team_b, kind, compute):
+        """Cached value of `kind` for a pair of teams, calling compute() if it is missing or stale."""
+        key = (team_a, team_b, kind)
+        versions = (self.store.team_version(team_a), self.store.team_version(team_b))
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        value = compute()
+        self.put(key, versions, value)
+        return value
+
+    def put(self, key, versions, value):
+        """Store a value, evicting the least recently used entries beyond maxsize."""
+        self.entries[key] = (versions, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def predict_match(self, team_a, team_b):
+        """Cached EloRatingSystem.predict_match."""
+        prediction = self.get(team_a, team_b, "match", lambda: self.elo_system.predict_match(team_a, team_b))
+        return dict(prediction) if prediction is not None else None
+
+    def predict_fixtures(self, fixtures):
+        """Cached predict.predict_fixtures: only the fixtures not in the cache are computed, in one pass."""
+        rows = []
+        missed = []
+        for index, (team_a, team_b) in enumerate(fixtures):
+            key = (team_a, team_b, "fixture")
+            versions = (self.store.team_version(team_a), self.store.team_version(team_b))
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == versions:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                rows.append(dict(entry[1]))
+            else:
+                self.misses += 1
+                rows.append(None)
+                missed.append((index, key, versions))
+        if missed:
+            for (index, key, versions), row in zip(missed, predict_fixtures(self.elo_system, [key[:2] for _, key, _ in missed])):
+                self.put(key, versions, row)
+                rows[index] = dict(row)
+        return rows
+
+    def weighted_outcome(self, team_a, team_b, weight_elo, weight_form):
+        """Cached optimize_weights.predict_weighted_outcome, using the store's form means."""
+        def compute():
+            expected_a_elo, expected_b_elo = self.elo_system.expected_score(team_a, team_b)
+            form_a = self.store.form_mean(team_a, self.elo_system.params)
+            form_b = self.store.form_mean(team_b, self.elo_system.params)
+            total_form = form_a + form_b if form_a + form_b != 0 else 1  # Avoid division by zero
+            return (weight_elo * expected_a_elo + weight_form * form_a / total_form,
+                    weight_elo * expected_b_elo + weight_form * form_b / total_form)
+
+        return self.get(team_a, team_b, ("weighted", weight_elo, weight_form), compute)
+
+    def stats(self):
+        """Hit and miss counts and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+def get_prediction_cache(elo_system, maxsize=4096):
+    """Get the PredictionCache of an EloRatingSystem, creating it on first use.
+
+    The cache is kept on the EloRatingSystem itself, so it is freed with it.
+    """
+    cache = elo_system.prediction_cache
+    if cache is None:
+        cache = elo_system.prediction_cache = PredictionCache(elo_system, maxsize)
+    return cache
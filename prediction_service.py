@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from binary_store import ArrayTeamStore
+from prediction_cache import PredictionCache
+from rating_core import EloRatingSystem, ModelParams, TeamStore
+
+MAX_BODY_SIZE = 10 * 1024 * 1024  # Largest accepted request body, in bytes
+
+
+class PredictionService:
+    def __init__(self, elo_file="teams.txt", params=None, poll_interval=1.0, cache_size=65536, state_file=None):
+        """Keeps the Elo ratings in memory and reloads them when the ratings file changes.
+
+        Each load builds a new EloRatingSystem with its own TeamStore and
+        prediction cache and swaps them in with a single assignment, so
+        requests already running keep using the ratings they started with.
+        With state_file, ratings are memory-mapped from that binary state
+        file (see binary_store) instead of parsed from elo_file.
+        """
+        self.elo_file = state_file or elo_file  # File that is watched for changes
+        self.state_file = state_file
+        self.params = params if params is not None else ModelParams()
+        self.poll_interval = poll_interval
+        self.cache_size = cache_size
+        self.cache = None  # PredictionCache of the loaded EloRatingSystem
+        self.file_stamp = None  # (mtime_ns, size) of the loaded ratings file
+        self.version = 0  # Incremented on every load
+        self.loaded_at = None
+
+    def file_stamp_now(self):
+        """Current (mtime_ns, size) of the ratings file, or None if it does not exist."""
+        try:
+            stat = os.stat(self.elo_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """Read the ratings file into a new EloRatingSystem and swap it in."""
+        file_stamp = self.file_stamp_now()
+        store = ArrayTeamStore(self.state_file) if self.state_file else TeamStore(elo_file=self.elo_file)
+        elo_system = EloRatingSystem(file_path=self.elo_file, store=store, params=self.params)
+        self.cache, self.file_stamp = PredictionCache(elo_system, self.cache_size), file_stamp
+        self.version += 1
+        self.loaded_at = time.time()
+
+    async def watch(self):
+        """Reload the ratings whenever the file's mtime or size changes, reading it in a worker thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            file_stamp = self.file_stamp_now()
+            if file_stamp is None or file_stamp == self.file_stamp:
+                continue  # Keep serving the old ratings while the file is missing
+            try:
+                await loop.run_in_executor(None, self.load)
+            except (OSError, ValueError) as error:
+                print(f"Could not reload {self.elo_file}: {error}")
+                continue
+            print(f"Reloaded {len(self.elo_system.ratings)} team ratings from {self.elo_file} (version {self.version})")
+
+    @property
+    def elo_system(self):
+        """The EloRatingSystem currently being served."""
+        return self.cache.elo_system
+
+    def predict(self, fixtures):
+        """Predict (team_a, team_b) fixtures with the current ratings."""
+        return self.cache.predict_fixtures(fixtures)
+
+    def health(self):
+        """Status of the loaded ratings and the prediction cache."""
+        return {"status": "ok", "teams": len(self.elo_system.ratings), "version": self.version,
+                "loaded_at": self.loaded_at, "cache": self.cache.stats()}
+
+    def handle(self, method, target, body):
+        """Route one request; returns (HTTPStatus, JSON-serializable response)."""
+        url = urlsplit(target)
+        if url.path == "/health" and method == "GET":
+            return HTTPStatus.OK, self.health()
+        if url.path != "/predict":
+            return HTTPStatus.NOT_FOUND, {"error": f"unknown path {url.path}"}
+        if method == "GET":
+            query = parse_qs(url.query)
+            if "team_a" not in query or "team_b" not in query:
+                return HTTPStatus.BAD_REQUEST, {"error": "team_a and team_b are required"}
+            return HTTPStatus.OK, self.predict([(query["team_a"][0], query["team_b"][0])])[0]
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"method {method} not allowed"}
+
+        try:
+            request = json.loads(body)
+            if "fixtures" not in request:
+                return HTTPStatus.OK, self.predict([parse_fixture(request)])[0]
+            return HTTPStatus.OK, {"predictions": self.predict([parse_fixture(fixture) for fixture in request["fixtures"]])}
+        except (ValueError, TypeError) as error:
+            return HTTPStatus.BAD_REQUEST, {"error": f"invalid request: {error}"}
+
+
+def parse_fixture(fixture):
+    """Read a fixture given as {"team_a": ..., "team_b": ...} or ["A", "B"]."""
+    if isinstance(fixture, dict):
+        fixture = (fixture.get("team_a"), fixture.get("team_b"))
+    if not isinstance(fixture, (list, tuple)) or len(fixture) != 2 or not all(isinstance(team, str) for team in fixture):
+        raise ValueError(f"expected two team names, got {fixture!r}")
+    return tuple(fixture)
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, target, headers, body) or None at end of stream."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_SIZE:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    """Write a JSON response."""
+    body = json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+
+async def serve_connection(service, reader, writer):
+    """Serve requests on one connection, keeping it open between requests unless the client closes it."""
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError) as error:
+                write_response(writer, HTTPStatus.BAD_REQUEST, {"error": str(error)}, keep_alive=False)
+                break
+            if request is None:
+                break
+            method, target, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            status, payload = service.handle(method, target, body)
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_service(service, host="127.0.0.1", port=8000, unix_socket=None):
+    """Load the ratings, start watching the file and serve requests until cancelled."""
+    service.load()
+
+    async def handler(reader, writer):
+        await serve_connection(service, reader, writer)
+
+    if unix_socket:
+        server = await asyncio.start_unix_server(handler, path=unix_socket)
+        print(f"Serving predictions for {len(service.elo_system.ratings)} teams on {unix_socket}")
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        print(f"Serving predictions for {len(service.elo_system.ratings)} teams on http://{host}:{port}")
+    watcher = asyncio.create_task(service.watch())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve match predictions over HTTP/JSON, reloading ratings when they change.")
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between checks of the ratings file")
+    parser.add_argument("--cache-size", type=int, default=65536, help="Number of fixture predictions kept in memory")
+    parser.add_argument("--state", help="Memory-mapped binary state file (.npy, see binary_store) instead of --elo-file")
+    args = parser.parse_args()
+
+    prediction_service = PredictionService(elo_file=args.elo_file, poll_interval=args.poll_interval,
+                                           cache_size=args.cache_size, state_file=args.state)
+    try:
+        asyncio.run(run_service(prediction_service, args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
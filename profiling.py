@@ -0,0 +1,91 @@
+import atexit
+import functools
+import json
+import os
+import time
+
+# Set BETTING_PROFILE to a file path to record hot-path timings and write them there at exit
+PROFILE_ENV = "BETTING_PROFILE"
+
+_enabled = bool(os.environ.get(PROFILE_ENV))
+counters = {}  # Name -> count
+timers = {}  # Name -> [calls, total seconds, slowest call in seconds]
+
+
+def enable():
+    """Start recording counters and timers."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording; what was recorded is kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Whether counters and timers are being recorded."""
+    return _enabled
+
+
+def reset():
+    """Forget everything recorded so far."""
+    counters.clear()
+    timers.clear()
+
+
+def count(name, amount=1):
+    """Add to a named counter (when enabled)."""
+    if _enabled:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def record(name, seconds):
+    """Add one timed call to a named timer."""
+    timer = timers.get(name)
+    if timer is None:
+        timer = timers[name] = [0, 0.0, 0.0]
+    timer[0] += 1
+    timer[1] += seconds
+    timer[2] = max(timer[2], seconds)
+
+
+def timed(name):
+    """Decorator that times every call of a function under `name` while recording is enabled."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start_time)
+        return wrapper
+    return decorator
+
+
+def report():
+    """Counters and timers as a JSON-serializable dictionary."""
+    return {
+        "counters": dict(sorted(counters.items())),
+        "timers": {
+            name: {"calls": calls, "total_s": total, "mean_us": total / calls * 1e6, "max_us": slowest * 1e6}
+            for name, (calls, total, slowest) in sorted(timers.items())
+        },
+    }
+
+
+def dump(file_path):
+    """Write the report to a JSON file atomically."""
+    from rating_core import write_atomic  # Imported here since rating_core itself is instrumented
+    write_atomic(file_path, [json.dumps(report(), indent=2) + '\n'])
+
+
+@atexit.register
+def _dump_at_exit():
+    file_path = os.environ.get(PROFILE_ENV)
+    if file_path and (counters or timers):
+        dump(file_path)
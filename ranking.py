@@ -0,0 +1,186 @@
+import argparse
+from bisect import bisect_left, insort
+
+from binary_store import ArrayTeamStore
+from league_state import STATE_DIR, get_league_store
+from rating_core import format_elo_lines, format_form_lines, get_store, write_atomic
+
+BOARDS = ("elo", "form", "combined")
+
+
+class Leaderboard:
+    def __init__(self):
+        """Teams kept sorted by score (highest first, ties by name), updated one team at a time."""
+        self.keys = []  # Sorted (-score, team) pairs
+        self.scores = {}  # Team -> score
+
+    def update(self, team, score):
+        """Set a team's score, moving it to its new position."""
+        old_score = self.scores.get(team)
+        if old_score == score:
+            return
+        if old_score is not None:
+            del self.keys[bisect_left(self.keys, (-old_score, team))]
+        self.scores[team] = score
+        insort(self.keys, (-score, team))
+
+    def remove(self, team):
+        """Drop a team from the board if it is on it."""
+        old_score = self.scores.pop(team, None)
+        if old_score is not None:
+            del self.keys[bisect_left(self.keys, (-old_score, team))]
+
+    def clear(self):
+        """Drop every team."""
+        self.keys.clear()
+        self.scores.clear()
+
+    def top(self, k=None):
+        """The k best (team, score) pairs, or all of them."""
+        return [(team, -negative_score) for negative_score, team in self.keys[:k]]
+
+    def rank(self, team):
+        """1-based rank of a team, or None if it is not on the board."""
+        score = self.scores.get(team)
+        return None if score is None else bisect_left(self.keys, (-score, team)) + 1
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class RankingIndex:
+    def __init__(self, store, form_weight=1.0, boards=BOARDS):
+        """Elo, form and combined leaderboards over a TeamStore, kept current from its team versions.
+
+        Each query first applies the teams touched since the last one, so
+        leaderboards are never re-sorted or re-read from disk after a match.
+        The combined score is the Elo rating plus form_weight points per
+        point of form score. Only the tables the chosen boards need are
+        loaded from the store.
+        """
+        self.store = store
+        self.form_weight = form_weight
+        self.boards = {board: Leaderboard() for board in boards}
+        self.uses_elo = "elo" in boards or "combined" in boards
+        self.uses_form = "form" in boards or "combined" in boards
+        self.synced_version = None  # Store version the boards reflect
+        self.reset_version = None  # Store reset version the boards were built from
+
+    def refresh(self):
+        """Apply changes made to the store since the last refresh."""
+        store = self.store
+        # Loading the files may reset the store, so do it first
+        elo_ratings = store.elo_ratings if self.uses_elo else {}
+        recent_form_history = store.recent_form_history if self.uses_form else {}
+        if self.reset_version != store.reset_version:
+            for board in self.boards.values():
+                board.clear()
+            teams = set(elo_ratings) | set(recent_form_history)
+        else:
+            teams = [team for team, version in store.team_versions.items() if version > self.synced_version]
+        for team in teams:
+            self.update_team(team)
+        self.reset_version = store.reset_version
+        self.synced_version = store.version
+
+    def update_team(self, team):
+        """Re-score one team on every board."""
+        elo = self.store.elo_ratings.get(team) if self.uses_elo else None
+        form = self.store.recent_form_history.get(team) if self.uses_form else None
+        form_score = form[0] if form is not None else 0
+        scores = {"elo": None if elo is None else elo[0],
+                  "form": None if form is None else form_score,
+                  "combined": None if elo is None else elo[0] + self.form_weight * form_score}
+        for board, leaderboard in self.boards.items():
+            if scores[board] is None:
+                leaderboard.remove(team)
+            else:
+                leaderboard.update(team, scores[board])
+
+    def top(self, board="elo", k=10):
+        """The k best (team, score) pairs of a leaderboard."""
+        self.refresh()
+        return self.boards[board].top(k)
+
+    def rank(self, team, board="elo"):
+        """1-based rank of a team on a leaderboard, or None if it is not on it."""
+        self.refresh()
+        return self.boards[board].rank(team)
+
+    def table(self, board="elo", k=10):
+        """Leaderboard rows with each team's rank, score, rating, matches played and form score."""
+        rows = []
+        for position, (team, score) in enumerate(self.top(board, k), start=1):
+            elo = self.store.elo_ratings.get(team) if self.uses_elo else None
+            rating, matches_played = elo if elo is not None else (None, 0)
+            form = self.store.recent_form_history.get(team) if self.uses_form else None
+            rows.append({"rank": position, "team": team, "score": score, "rating": rating,
+                         "matches_played": matches_played, "form_score": form[0] if form is not None else 0})
+        return rows
+
+    def ranked_elo_ratings(self):
+        """Elo ratings ordered by rating, in the Elo file layout."""
+        return {team: self.store.elo_ratings[team] for team, _ in self.top("elo", None)}
+
+    def ranked_form_history(self):
+        """Recent form ordered by form score, in the recent form file layout."""
+        return {team: self.store.recent_form_history[team] for team, _ in self.top("form", None)}
+
+
+_indexes = {}
+
+
+def get_ranking_index(store, form_weight=1.0):
+    """Get the process-wide RankingIndex of a store, creating it on first use."""
+    key = (id(store), form_weight)
+    index = _indexes.get(key)
+    if index is None or index.store is not store:
+        index = _indexes[key] = RankingIndex(store, form_weight)
+    return index
+
+
+def write_ranked(index, board, output_file):
+    """Write the Elo or form leaderboard as a sorted Elo or recent form file."""
+    if board == "elo":
+        write_atomic(output_file, format_elo_lines(index.ranked_elo_ratings()))
+    elif board == "form":
+        write_atomic(output_file, format_form_lines(index.ranked_form_history()))
+    else:
+        raise ValueError("Only the elo and form leaderboards can be written as state files.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show leaderboards and team ranks from the rating state.")
+    parser.add_argument("--board", choices=BOARDS, default="elo")
+    parser.add_argument("--top", type=int, default=10, help="Number of teams to show (0 for all)")
+    parser.add_argument("--team", help="Show this team's rank on every leaderboard instead")
+    parser.add_argument("--league", help="Use a league's state from the state directory")
+    parser.add_argument("--state-dir", default=STATE_DIR)
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--form-file", default="recent_form.txt")
+    parser.add_argument("--state", help="Memory-mapped binary state file (.npy, see binary_store) instead of text files")
+    parser.add_argument("--form-weight", type=float, default=1.0, help="Elo points per form point on the combined board")
+    parser.add_argument("--output", help="Write the elo or form leaderboard as a sorted state file")
+    args = parser.parse_args()
+
+    if args.state:
+        store = ArrayTeamStore(args.state)
+    elif args.league:
+        store = get_league_store(args.league, args.state_dir)
+    else:
+        store = get_store(elo_file=args.elo_file, form_file=args.form_file)
+    index = get_ranking_index(store, args.form_weight)
+
+    if args.team:
+        for board in BOARDS:
+            rank = index.rank(args.team, board)
+            print(f"{args.team} {board}: " + (f"#{rank} of {len(index.boards[board])}" if rank else "not ranked"))
+    elif args.output:
+        if args.board == "combined":
+            parser.error("--output only supports the elo and form boards")
+        write_ranked(index, args.board, args.output)
+        print(f"Teams sorted by {args.board} and saved to {args.output}.")
+    else:
+        for row in index.table(args.board, args.top or None):
+            rating = f"{row['rating']:.0f}" if row["rating"] is not None else "-"
+            print(f"{row['rank']:>3}. {row['team']:<25} {row['score']:9.2f}  (Elo {rating}, form {row['form_score']:.2f})")
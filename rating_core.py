@@ -0,0 +1,366 @@
+import json
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from datetime import date
+
+from profiling import timed
+
+DEFAULT_RATING = 1500
+
+# Form history values are always saved with two decimals, which tells them
+# apart from numeric tokens inside team names (e.g. "Schalke 04")
+FORM_VALUE = re.compile(r"-?\d+\.\d+")
+
+FORM_MODES = ("window", "decay")
+
+
+@dataclass(frozen=True)
+class ModelParams:
+    """Tunable knobs of the Elo, form and draw models; the defaults are the original model."""
+    k_factor: float = 30
+    elo_scale: float = 400  # Rating difference at which the stronger team is 10x more likely to win
+    elo_diff_scale: float = 100  # Rating difference that shifts a form change by one point
+    form_window: int = 6  # Number of recent matches in the form score
+    form_win: float = 10  # Form change for a win (and minus this for a loss)
+    form_draw: float = 5  # Form change for a draw, gained by team_b and lost by team_a
+    max_draw_prob: float = 0.3  # Draw probability when teams are evenly matched
+    min_draw_prob: float = 0.05  # Draw probability when the skill gap is largest
+    season_regression: float = 0  # Fraction of each rating's distance from 1500 removed between seasons
+    form_mode: str = "window"  # "window" sums the last form_window changes, "decay" keeps an exponentially decayed sum
+    form_half_life: float = 3  # Matches after which a form change counts half, in decay mode
+    form_half_life_days: float = 0  # If set, decay by days between a team's matches when match dates are given
+
+    def __post_init__(self):
+        if self.form_mode not in FORM_MODES:
+            raise ValueError(f"Unknown form mode {self.form_mode!r}; expected one of {', '.join(FORM_MODES)}.")
+        if self.form_half_life <= 0:
+            raise ValueError(f"form_half_life must be positive, got {self.form_half_life}.")
+        if self.form_half_life_days < 0:
+            raise ValueError(f"form_half_life_days must be positive, or 0 to decay by matches; got {self.form_half_life_days}.")
+
+    def form_decay(self, elapsed_days=None):
+        """Factor applied to a decayed form score before adding a new change."""
+        if elapsed_days is not None and self.form_half_life_days:
+            return 0.5 ** (max(elapsed_days, 0) / self.form_half_life_days)
+        return 0.5 ** (1 / self.form_half_life)
+
+
+def _read_umask():
+    """Current process umask (it can only be read by setting it)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _read_umask()
+
+
+def file_mode(file_path):
+    """Permission bits of an existing file, or those a new file gets from the umask."""
+    try:
+        return os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+def write_atomic(file_path, lines, binary=False):
+    """Write lines (or bytes chunks with binary) to a file atomically via a temporary file and rename.
+
+    The file keeps its permissions, since mkstemp creates the temporary
+    file readable by its owner only.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_path, file_mode(file_path))
+        os.replace(temp_path, file_path)  # Atomic on POSIX and Windows
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def parse_elo_line(line):
+    """Parse a "Team Name rating matches_played" line into (team, rating, matches_played)."""
+    team, rating, matches_played = line.rsplit(None, 2)
+    return team, float(rating), int(matches_played)
+
+
+def parse_form_line(line):
+    """Parse a "form_score Team Name history..." line into (team, form_score, form_history)."""
+    parts = line.split()
+    form_score = float(parts[0])
+
+    # History is the trailing run of form values, always leaving at least one name token
+    team_name_end = len(parts)
+    while team_name_end > 2 and FORM_VALUE.fullmatch(parts[team_name_end - 1]):
+        team_name_end -= 1
+
+    team = ' '.join(parts[1:team_name_end])
+    form_history = [float(f) for f in parts[team_name_end:]]
+    return team, form_score, form_history
+
+
+def load_elo_file(file_path):
+    """Load {team: [rating, matches_played]} from an Elo file."""
+    elo_ratings = {}
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                team, rating, matches_played = parse_elo_line(line)
+                elo_ratings[team] = [rating, matches_played]
+    return elo_ratings
+
+
+def load_form_file(file_path):
+    """Load {team: (form_score, form_history)} from a recent form file."""
+    recent_form_history = {}
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                team, form_score, form_history = parse_form_line(line)
+                recent_form_history[team] = (form_score, form_history)
+    return recent_form_history
+
+
+def format_elo_lines(elo_ratings):
+    """Format Elo ratings as lines of the Elo file."""
+    return [f"{team} {int(rating)} {matches_played}\n" for team, (rating, matches_played) in elo_ratings.items()]
+
+
+def format_form_lines(recent_form_history):
+    """Format recent form as lines of the recent form file."""
+    lines = []
+    for team, (form_score, form_history) in recent_form_history.items():
+        # Form score followed by the team name and form history
+        form_str = ' '.join([f"{f:.2f}" for f in form_history])
+        lines.append(f"{form_score:.2f} {team} {form_str}\n")
+    return lines
+
+
+def elo_expected_score(rating_a, rating_b, elo_scale=400):
+    """Elo expected score of team_a against team_b; works on floats and NumPy arrays."""
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / elo_scale))
+
+
+def draw_adjusted_probabilities(expected_a, expected_b, max_draw_prob=0.3, min_draw_prob=0.05):
+    """Turn expected scores into (win_a, draw, win_b) probabilities; works on floats and NumPy arrays.
+
+    The draw probability shrinks from max_draw_prob for evenly matched teams
+    to min_draw_prob as the gap between the expected scores grows.
+    """
+    skill_gap = abs(expected_a - expected_b)
+    draw_prob = max_draw_prob - skill_gap * (max_draw_prob - min_draw_prob)
+    return expected_a * (1 - draw_prob), draw_prob, expected_b * (1 - draw_prob)
+
+
+def day_number(match_date):
+    """Day number of a match date given as a date or an ISO string (e.g. a NumPy datetime64)."""
+    if isinstance(match_date, date):
+        return match_date.toordinal()
+    return date.fromisoformat(str(match_date)[:10]).toordinal()
+
+
+def form_days_file(form_file):
+    """File next to a recent form file holding each team's last match day, for date-aware form decay."""
+    return os.path.splitext(form_file)[0] + "_days.json"
+
+
+def form_mean(form_history, form_score=0.0, params=None):
+    """Mean of a form history, 0 if it is empty.
+
+    In decay mode (params.form_mode) the history is not kept and this is the
+    decay-weighted mean of all form changes, taken from the form score;
+    that case also works on NumPy arrays of scores.
+    """
+    if params is not None and params.form_mode == "decay":
+        return form_score * (1 - params.form_decay())
+    return sum(form_history) / len(form_history) if form_history else 0.0
+
+
+class TeamStore:
+    def __init__(self, elo_file="teams.txt", form_file="recent_form.txt"):
+        """In-memory Elo and form state for one pair of files, loaded lazily on first use."""
+        self.elo_file = elo_file
+        self.form_file = form_file
+        self._elo_ratings = None
+        self._recent_form_history = None
+        self._form_days = None
+        self.version = 0  # Incremented on every change, so caches can tell stale entries apart
+        self.reset_version = 0  # Version of the last change to the whole state
+        self.team_versions = {}  # Team -> version of its last change since then
+        self.form_means = {}  # Team -> mean of its form history, kept up to date by update_form
+
+    @property
+    def elo_ratings(self):
+        """{team: [rating, matches_played]}, shared by every user of this store."""
+        if self._elo_ratings is None:
+            self._elo_ratings = {}
+            self.reload_elo()
+        return self._elo_ratings
+
+    @property
+    def recent_form_history(self):
+        """{team: (form_score, form_history)}, shared by every user of this store."""
+        if self._recent_form_history is None:
+            self._recent_form_history = {}
+            self.reload_form()
+        return self._recent_form_history
+
+    @property
+    def form_days(self):
+        """{team: day number of its last match}, only kept for date-aware form decay."""
+        if self._form_days is None:
+            try:
+                with open(form_days_file(self.form_file), 'r') as file:
+                    self._form_days = json.load(file)
+            except FileNotFoundError:
+                self._form_days = {}
+        return self._form_days
+
+    @timed("store.reload_elo")
+    def reload_elo(self):
+        """Re-read the Elo file, updating the shared dictionary in place."""
+        try:
+            elo_ratings = load_elo_file(self.elo_file)
+        except FileNotFoundError:
+            print(f"File {self.elo_file} not found. Please create it with team ratings.")
+            elo_ratings = {}
+        self.elo_ratings.clear()
+        self.elo_ratings.update(elo_ratings)
+        self.invalidate()
+
+    @timed("store.reload_form")
+    def reload_form(self):
+        """Re-read the recent form file, updating the shared dictionary in place."""
+        try:
+            recent_form_history = load_form_file(self.form_file)
+        except FileNotFoundError:
+            print(f"File {self.form_file} not found. Starting with empty form data.")
+            recent_form_history = {}
+        self.recent_form_history.clear()
+        self.recent_form_history.update(recent_form_history)
+        self._form_days = None
+        self.invalidate()
+
+    def touch(self, *teams):
+        """Record that the given teams' ratings or form changed.
+
+        Form means are left alone, since update_form sets them itself and
+        Elo updates do not change them.
+        """
+        self.version += 1
+        for team in teams:
+            self.team_versions[team] = self.version
+
+    def invalidate(self):
+        """Record that the whole state changed, e.g. after a reload or a bulk replace."""
+        self.version += 1
+        self.reset_version = self.version
+        self.team_versions.clear()
+        self.form_means.clear()
+
+    def team_version(self, team):
+        """Version of a team's last change; unchanged until the team is touched."""
+        return self.team_versions.get(team, self.reset_version)
+
+    def form_mean(self, team, params=None):
+        """Mean of a team's form history (0 for teams without form), cached until the team changes.
+
+        With decay-mode params the mean comes from the form score instead,
+        which is cheap enough not to cache.
+        """
+        if params is not None and params.form_mode == "decay":
+            return form_mean((), self.recent_form_history.get(team, (0, []))[0], params)
+        mean = self.form_means.get(team)
+        if mean is None:
+            form_history = self.recent_form_history.get(team, (0, []))[1]
+            mean = self.form_means[team] = form_mean(form_history)
+        return mean
+
+    @timed("store.save_elo")
+    def save_elo(self):
+        """Save the Elo ratings to the Elo file."""
+        write_atomic(self.elo_file, format_elo_lines(self.elo_ratings))
+
+    @timed("store.save_form")
+    def save_form(self):
+        """Save the recent form to the recent form file."""
+        write_atomic(self.form_file, format_form_lines(self.recent_form_history))
+        if self._form_days:
+            write_atomic(form_days_file(self.form_file), [json.dumps(self._form_days, sort_keys=True) + '\n'])
+
+
+_stores = {}
+
+
+def get_store(elo_file="teams.txt", form_file="recent_form.txt"):
+    """Get the process-wide TeamStore for a pair of files, creating it on first use."""
+    key = (os.path.abspath(elo_file), os.path.abspath(form_file))
+    store = _stores.get(key)
+    if store is None:
+        store = _stores[key] = TeamStore(elo_file, form_file)
+    return store
+
+
+def clear_stores():
+    """Forget all cached stores so the next get_store() re-reads the files."""
+    _stores.clear()
+
+
+class EloRatingSystem:
+    def __init__(self, k_factor=30, file_path="teams.txt", store=None, params=None):
+        """Initialize Elo rating system with a K-factor and file path for team ratings.
+
+        params overrides the K-factor and the other model settings when given.
+        """
+        self.params = params if params is not None else ModelParams(k_factor=k_factor)
+        self.k_factor = self.params.k_factor
+        self.file_path = file_path
+        self.store = store if store is not None else get_store(elo_file=file_path)
+        self.ratings = {}
+        self.prediction_cache = None  # Set by prediction_cache.get_prediction_cache
+        self.load_ratings()
+
+    def load_ratings(self):
+        """Use the team ratings and matches played of the shared store (read from file once per process)."""
+        self.ratings = self.store.elo_ratings
+
+    def get_rating(self, team):
+        """Get rating and matches played for a team, 1500 and 0 matches if not present.
+
+        Unknown teams are not added, since the ratings are shared with other tools.
+        """
+        return self.ratings.get(team, [DEFAULT_RATING, 0])
+
+    def expected_score(self, team_a, team_b):
+        """Calculate the expected score for two teams based on their ratings."""
+        rating_a = self.get_rating(team_a)[0]  # Get team A's rating
+        rating_b = self.get_rating(team_b)[0]  # Get team B's rating
+        expected_a = elo_expected_score(rating_a, rating_b, self.params.elo_scale)  # Expected score for team A
+        expected_b = 1 - expected_a  # Expected score for team B
+        return expected_a, expected_b
+
+    @timed("elo.predict_match")
+    def predict_match(self, team_a, team_b):
+        """Predict the outcome probabilities of a match between two teams."""
+
+        # Check if both teams exist in the ratings
+        if team_a not in self.ratings or team_b not in self.ratings:
+            print(f"One or both teams ({team_a}, {team_b}) do not exist in the database.")
+            return None
+
+        expected_a, expected_b = self.expected_score(team_a, team_b)
+
+        # Adjust win probabilities with a draw probability that depends on the skill gap
+        win_a_prob, draw_prob, win_b_prob = draw_adjusted_probabilities(
+            expected_a, expected_b, self.params.max_draw_prob, self.params.min_draw_prob)
+
+        return {"win_a": win_a_prob, "draw": draw_prob, "win_b": win_b_prob}
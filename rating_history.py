@@ -0,0 +1,289 @@
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+
+from match_parser import RESULTS, iter_matches
+from rating_core import write_atomic
+from recent_form import FormRatingSystem
+from replay_engine import ReplayEngine
+
+
+class RatingHistory:
+    def __init__(self, engine=None, checkpoint_interval=100):
+        """Append-only history of every match and its per-team rating and form deltas.
+
+        Matches are replayed through `engine` (a fresh ReplayEngine by
+        default) and a full state snapshot is kept every
+        checkpoint_interval matches, so any earlier state can be rebuilt by
+        replaying at most checkpoint_interval matches.
+        """
+        self.engine = engine if engine is not None else ReplayEngine()
+        self.checkpoint_interval = checkpoint_interval
+        self.match_count = 0
+        self._matches = []  # Chunks of (ids_a, ids_b, results)
+        self._deltas = []  # Chunks of {"seq", "team", "elo_before", "elo_after", "form_change"}
+        self._match_arrays = None  # Concatenated caches, rebuilt after appends
+        self._delta_arrays = None
+        self._team_index = None
+        self.checkpoints = {0: self.engine.to_array()}  # Match sequence -> state before that match
+
+    @property
+    def team_names(self):
+        """Team names by integer id."""
+        return self.engine.team_names
+
+    def record(self, matches):
+        """Replay (team_a, team_b, result) tuples and append them to the history; returns their sequence numbers."""
+        ids_a, ids_b, results = self.engine.encode_matches(matches)
+        start = self.match_count
+        offset = 0
+        while offset < len(results):
+            # Chunks end on checkpoint boundaries, so every checkpoint is an exact state
+            stop = min(offset + self.checkpoint_interval - self.match_count % self.checkpoint_interval, len(results))
+            self._record_chunk(ids_a[offset:stop], ids_b[offset:stop], results[offset:stop])
+            offset = stop
+        return np.arange(start, self.match_count)
+
+    def _record_chunk(self, ids_a, ids_b, results):
+        """Replay one chunk of encoded matches, logging deltas, and checkpoint on interval boundaries."""
+        if not len(results):
+            return
+        seq = self.match_count + np.arange(len(results))
+        trace = self.engine.trace_encoded(ids_a, ids_b, results)
+        team = np.concatenate([ids_a, ids_b])
+        elo_before = np.concatenate([trace["elo_a"], trace["elo_b"]])
+        elo_after = np.concatenate([trace["new_elo_a"], trace["new_elo_b"]])
+        form_change = np.concatenate([trace["form_change_a"], trace["form_change_b"]])
+
+        self._matches.append((ids_a, ids_b, results))
+        self._deltas.append({"seq": np.concatenate([seq, seq]), "team": team, "elo_before": elo_before,
+                             "elo_after": elo_after, "form_change": form_change})
+        self._match_arrays = self._delta_arrays = self._team_index = None
+        self.match_count += len(results)
+        if self.match_count % self.checkpoint_interval == 0:
+            self.checkpoints[self.match_count] = self.engine.to_array()
+
+    def matches(self):
+        """(ids_a, ids_b, results) arrays of all recorded matches, indexed by sequence number."""
+        if self._match_arrays is None:
+            chunks = self._matches or [(np.zeros(0, dtype=np.int64),) * 3]
+            self._match_arrays = tuple(np.concatenate(column) for column in zip(*chunks))
+        return self._match_arrays
+
+    def deltas(self):
+        """Per-team delta columns of all recorded matches, two rows per match."""
+        if self._delta_arrays is None:
+            names = ("seq", "team", "elo_before", "elo_after", "form_change")
+            if self._deltas:
+                self._delta_arrays = {name: np.concatenate([chunk[name] for chunk in self._deltas]) for name in names}
+            else:
+                self._delta_arrays = {name: np.zeros(0, dtype=np.int64 if name in ("seq", "team") else float)
+                                      for name in names}
+        return self._delta_arrays
+
+    def _index(self):
+        """Delta row order sorted by (team, seq), with each team's start offset."""
+        if self._team_index is None:
+            deltas = self.deltas()
+            order = np.lexsort((deltas["seq"], deltas["team"]))
+            starts = np.searchsorted(deltas["team"][order], np.arange(len(self.team_names) + 1))
+            self._team_index = (order, starts)
+        return self._team_index
+
+    def team_rows(self, team):
+        """Delta rows of one team in sequence order."""
+        team_id = self.engine.team_ids.get(team)
+        if team_id is None:
+            return np.zeros(0, dtype=np.int64)
+        order, starts = self._index()
+        return order[starts[team_id]:starts[team_id + 1]]
+
+    def team_matches(self, team):
+        """Sequence numbers of a team's recorded matches (e.g. [11] is its 12th match)."""
+        return self.deltas()["seq"][self.team_rows(team)]
+
+    def _initial_state(self, team):
+        """A team's row in the state before the first recorded match, or None."""
+        initial = self.checkpoints[0]
+        rows = np.flatnonzero(initial["team"] == team)
+        return initial[rows[0]] if len(rows) else None
+
+    def rating_at(self, team, seq):
+        """A team's Elo rating before match `seq` (None if it was not rated yet)."""
+        rows = self.team_rows(team)
+        deltas = self.deltas()
+        before = np.searchsorted(deltas["seq"][rows], seq)
+        if before:
+            return float(deltas["elo_after"][rows[before - 1]])
+        initial = self._initial_state(team)
+        return float(initial["rating"]) if initial is not None and initial["has_elo"] else None
+
+    def form_at(self, team, seq):
+        """A team's recent form history (oldest first) before match `seq`.
+
+        In decay mode these are the latest form changes folded into the
+        decayed form score, since the state keeps no history.
+        """
+        rows = self.team_rows(team)
+        deltas = self.deltas()
+        before = np.searchsorted(deltas["seq"][rows], seq)
+        changes = deltas["form_change"][rows[:before]].tolist()
+        window = self.engine.form_window
+        if len(changes) < window:
+            initial = self._initial_state(team)
+            if initial is not None and initial["has_form"]:
+                changes = initial["form_history"][:initial["form_length"]].tolist() + changes
+        return changes[-window:]
+
+    def nearest_checkpoint(self, seq):
+        """Sequence number of the latest checkpoint at or before `seq`."""
+        return max(checkpoint for checkpoint in self.checkpoints if checkpoint <= seq)
+
+    def snapshot(self, seq):
+        """A new ReplayEngine holding the full state before match `seq`.
+
+        The nearest earlier checkpoint is restored and only the matches after
+        it are replayed.
+        """
+        if not 0 <= seq <= self.match_count:
+            raise ValueError(f"Sequence {seq} is outside the history (0-{self.match_count}).")
+        checkpoint = self.nearest_checkpoint(seq)
+        engine = ReplayEngine(params=self.engine.params)
+        engine.load_array(self.checkpoints[checkpoint])
+        for team in self.team_names[len(engine.team_names):]:
+            engine.team_id(team)  # Keep the same ids for teams first seen after the checkpoint
+        ids_a, ids_b, results = self.matches()
+        engine.replay_encoded(ids_a[checkpoint:seq], ids_b[checkpoint:seq], results[checkpoint:seq])
+        return engine
+
+    def rewind(self, seq):
+        """Drop every match from `seq` on and restore the state before it, so new matches can be recorded."""
+        ids_a, ids_b, results = self.matches()
+        deltas = self.deltas()
+        keep = deltas["seq"] < seq
+        self.engine = self.snapshot(seq)
+        self._matches = [(ids_a[:seq], ids_b[:seq], results[:seq])] if seq else []
+        self._deltas = [{name: values[keep] for name, values in deltas.items()}] if seq else []
+        self._match_arrays = self._delta_arrays = self._team_index = None
+        self.checkpoints = {checkpoint: state for checkpoint, state in self.checkpoints.items() if checkpoint <= seq}
+        self.match_count = seq
+
+    def decode_matches(self, start=0, stop=None):
+        """(team_a, team_b, result) tuples of recorded matches start to stop."""
+        ids_a, ids_b, results = (column[start:stop] for column in self.matches())
+        return [(self.team_names[team_a], self.team_names[team_b], RESULTS[result])
+                for team_a, team_b, result in zip(ids_a.tolist(), ids_b.tolist(), results.tolist())]
+
+    def amend(self, seq, matches, replace=0):
+        """Replace `replace` matches from `seq` on with `matches` and recompute only what follows.
+
+        Since Elo and the form window are path-dependent, every match from
+        `seq` on is replayed, starting from the nearest checkpoint instead of
+        the beginning. Returns the number of matches replayed.
+        """
+        if not 0 <= seq <= seq + replace <= self.match_count:
+            raise ValueError(f"Matches {seq}-{seq + replace} are outside the history (0-{self.match_count}).")
+        suffix = list(matches) + self.decode_matches(seq + replace)
+        self.rewind(seq)
+        self.record(suffix)
+        return len(suffix)
+
+    def correct(self, seq, match):
+        """Replace the (team_a, team_b, result) match at `seq` and recompute the matches after it."""
+        return self.amend(seq, [match], replace=1)
+
+    def insert(self, seq, match):
+        """Insert a missing (team_a, team_b, result) match before `seq` and recompute the matches after it."""
+        return self.amend(seq, [match])
+
+    def sync(self, matches):
+        """Bring the history in line with a full, possibly corrected, match sequence.
+
+        Only the matches from the first one that differs from the history
+        are replayed. Returns (first changed sequence number, matches replayed).
+        """
+        matches = list(matches)
+        ids_a, ids_b, results = self.engine.encode_matches(matches)
+        old_a, old_b, old_results = self.matches()
+        common = min(len(results), self.match_count)
+        changed = np.flatnonzero((ids_a[:common] != old_a[:common]) | (ids_b[:common] != old_b[:common])
+                                 | (results[:common] != old_results[:common]))
+        seq = int(changed[0]) if len(changed) else common
+        if seq == len(results) == self.match_count:
+            return seq, 0
+        return seq, self.amend(seq, matches[seq:], replace=self.match_count - seq)
+
+    def save(self, file_path):
+        """Save the history to a .npz file atomically."""
+        ids_a, ids_b, results = self.matches()
+        arrays = {"team_names": np.array(self.team_names, dtype=str), "ids_a": ids_a, "ids_b": ids_b,
+                  "results": results, "checkpoint_interval": np.array(self.checkpoint_interval),
+                  **{f"delta_{name}": values for name, values in self.deltas().items()},
+                  **{f"state_{checkpoint}": state for checkpoint, state in self.checkpoints.items()}}
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        write_atomic(file_path, [buffer.getbuffer()], binary=True)
+
+    @classmethod
+    def load(cls, file_path, params=None):
+        """Load a history saved with save(); the current state is rebuilt from the last checkpoint."""
+        with np.load(file_path, allow_pickle=False) as data:
+            history = cls(ReplayEngine(params=params), checkpoint_interval=int(data["checkpoint_interval"]))
+            for team in data["team_names"].tolist():
+                history.engine.team_id(team)
+            history.checkpoints = {int(name[len("state_"):]): data[name]
+                                   for name in data.files if name.startswith("state_")}
+            history._matches = [(data["ids_a"], data["ids_b"], data["results"])]
+            history._deltas = [{name[len("delta_"):]: data[name] for name in data.files if name.startswith("delta_")}]
+        history.match_count = len(history._matches[0][2])
+        history.engine = history.snapshot(history.match_count)
+        return history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a rating history from match files and query past ratings.")
+    parser.add_argument("match_files", nargs="*", help="Match files to record, in order")
+    parser.add_argument("--history", help="History file (.npz) to load first and save afterwards")
+    parser.add_argument("--checkpoint-interval", type=int, default=100)
+    parser.add_argument("--team", help="Team to query")
+    parser.add_argument("--before-match", type=int, help="Show the team's state before its Nth recorded match (1-based)")
+    parser.add_argument("--sync", action="store_true",
+                        help="Treat the match files as the full, corrected sequence and only replay from the first change")
+    parser.add_argument("--save-state", action="store_true", help="Write the current state to the form and Elo files")
+    parser.add_argument("--form-file", default="recent_form.txt")
+    parser.add_argument("--elo-file", default="teams.txt")
+    args = parser.parse_args()
+
+    if args.history and os.path.exists(args.history):
+        history = RatingHistory.load(args.history)
+    else:
+        history = RatingHistory(checkpoint_interval=args.checkpoint_interval)
+    if args.sync:
+        matches = [match for match_file in args.match_files for match in iter_matches(match_file)]
+        start_time = time.perf_counter()
+        seq, replayed = history.sync(matches)
+        print(f"First change at match {seq}, replayed {replayed} matches in {time.perf_counter() - start_time:.4f}s")
+    else:
+        for match_file in args.match_files:
+            history.record(iter_matches(match_file))
+    if args.history:
+        history.save(args.history)
+    print(f"{history.match_count} matches recorded, {len(history.checkpoints)} checkpoints")
+    if args.save_state:
+        form_system = FormRatingSystem(form_file=args.form_file, elo_file=args.elo_file)
+        history.engine.export_to(form_system)
+        form_system.save_form()
+        form_system.save_elo()
+
+    if args.team:
+        team_matches = history.team_matches(args.team)
+        seq = history.match_count
+        if args.before_match is not None:
+            if not 1 <= args.before_match <= len(team_matches):
+                parser.error(f"{args.team} has {len(team_matches)} recorded matches")
+            seq = int(team_matches[args.before_match - 1])
+        print(f"{args.team} before match {seq}: rating {history.rating_at(args.team, seq)}, "
+              f"form {[round(value, 2) for value in history.form_at(args.team, seq)]}")
@@ -1,110 +1,102 @@
+from contextlib import contextmanager
+
+from profiling import timed
+from rating_core import DEFAULT_RATING, ModelParams, day_number, elo_expected_score, get_store
+
+
 class FormRatingSystem:
-    def __init__(self, form_file="recent_form.txt", elo_file="teams.txt", form_decay_rate=20):
-        """Initialize Form Rating system with paths to form and Elo files, and form decay rate."""
+    def __init__(self, form_file="recent_form.txt", elo_file="teams.txt", form_decay_rate=20, flush_interval=None, params=None):
+        """Initialize Form Rating system with paths to form and Elo files, and form decay rate.
+
+        flush_interval is the number of matches after which a batch is written
+        to disk; None means a batch is only written once, when it ends.
+        params holds the K-factor, form increments and other model settings,
+        including the form mode; form_decay_rate is unused and only kept for
+        compatibility (see params.form_half_life).
+        """
+        self.params = params if params is not None else ModelParams()
         self.form_file = form_file
         self.elo_file = elo_file
         self.form_decay_rate = form_decay_rate
+        self.flush_interval = flush_interval
+        self.store = get_store(elo_file=elo_file, form_file=form_file)  # State shared with other tools in this process
         self.recent_form_history = {}  # Store last 6 match results for each team
         self.elo_ratings = {}
+        self._batch_depth = 0  # Nesting level of active batch() blocks
+        self._pending_updates = 0  # Matches applied in memory but not yet saved
         self.load_form()
         self.load_elo()
 
     def load_form(self):
-        """Load recent form history and final form score from a text file."""
-        try:
-            with open(self.form_file, 'r') as file:
-                for line in file:
-                    line = line.strip()
-                    if line:
-                        # Split the first element (form score) and the rest (team name and history)
-                        parts = line.split()
-                        form_score = float(parts[0])  # Convert form score to float
-                        
-                        # Find where the team name ends and form history starts
-                        for i in range(1, len(parts)):
-                            try:
-                                # If we can convert this part to a float, it's part of the form history
-                                float(parts[i])
-                                team_name_end = i
-                                break
-                            except ValueError:
-                                continue
-                        
-                        # Extract team name and form history
-                        team = ' '.join(parts[1:team_name_end])
-                        form_history = [float(f) for f in parts[team_name_end:]]
-                        
-                        self.recent_form_history[team] = (form_score, form_history)
-        except FileNotFoundError:
-            print(f"File {self.form_file} not found. Starting with empty form data.")
+        """Use the recent form history and final form score of the shared store."""
+        self.recent_form_history = self.store.recent_form_history
 
     def save_form(self):
         """Save updated recent form history and form score to a text file."""
-        with open(self.form_file, 'w') as file:
-            for team, (form_score, form_history) in self.recent_form_history.items():
-                # Save form score followed by the team name and form history
-                form_str = ' '.join([f"{f:.2f}" for f in form_history])
-                file.write(f"{form_score:.2f} {team} {form_str}\n")
+        self.store.save_form()
 
     def load_elo(self):
-        """Load Elo ratings from the Elo file."""
-        try:
-            with open(self.elo_file, 'r') as file:
-                for line in file:
-                    line = line.strip()
-                    if line:
-                        *team_parts, rating, matches_played = line.split()
-                        team = ' '.join(team_parts)
-                        self.elo_ratings[team] = [float(rating), int(matches_played)]
-        except FileNotFoundError:
-            print(f"File {self.elo_file} not found. Please create it with team ratings.")
+        """Use the Elo ratings of the shared store."""
+        self.elo_ratings = self.store.elo_ratings
 
     def save_elo(self):
         """Save updated Elo ratings to the Elo file."""
-        with open(self.elo_file, 'w') as file:
-            for team, (rating, matches_played) in self.elo_ratings.items():
-                file.write(f"{team} {int(rating)} {matches_played}\n")
+        self.store.save_elo()
 
     def get_team_data(self, team):
         """Get the recent form history and Elo rating for a team, initializing if not present."""
         if team not in self.recent_form_history:
             self.recent_form_history[team] = (0, [])  # Initialize form score to 0 and empty history
         if team not in self.elo_ratings:
-            self.elo_ratings[team] = [1500, 0]  # Default Elo: 1500, 0 matches played
+            self.elo_ratings[team] = [DEFAULT_RATING, 0]  # Default Elo: 1500, 0 matches played
         return self.recent_form_history[team], self.elo_ratings[team]
 
     def calculate_total_recent_form(self, form_history):
-        """Calculate the total recent form score based on the last 6 matches."""
-        # Use only the last 6 matches, sum them up to calculate the total
-        return sum(form_history[-6:])
+        """Calculate the total recent form score based on the last matches of the form window."""
+        # Use only the last form_window (6 by default) matches, sum them up to calculate the total
+        return sum(form_history[-self.params.form_window:])
+
+    def update_form(self, team_a, team_b, result, match_date=None):
+        """Update recent form for both teams based on match result and Elo difference.
 
-    def update_form(self, team_a, team_b, result):
-        """Update recent form for both teams based on match result and Elo difference."""
+        match_date is only used in decay mode with params.form_half_life_days.
+        """
         (form_score_a, form_a), (elo_a, _) = self.get_team_data(team_a)
         (form_score_b, form_b), (elo_b, _) = self.get_team_data(team_b)
 
         # Calculate Elo difference
-        elo_diff = (elo_b - elo_a) / 100  # Normalize Elo difference
+        elo_diff = (elo_b - elo_a) / self.params.elo_diff_scale  # Normalize Elo difference
+        form_win = self.params.form_win
+        form_draw = self.params.form_draw
 
         if result == "win_a":
-            form_change_a = 10 + elo_diff  # Weaker team gains more for a win
-            form_change_b = -10 - elo_diff  # Stronger team loses more for a loss
+            form_change_a = form_win + elo_diff  # Weaker team gains more for a win
+            form_change_b = -form_win - elo_diff  # Stronger team loses more for a loss
         elif result == "win_b":
-            form_change_a = -10 + elo_diff  # Stronger team loses less
-            form_change_b = 10 - elo_diff   # Weaker team gains more
+            form_change_a = -form_win + elo_diff  # Stronger team loses less
+            form_change_b = form_win - elo_diff   # Weaker team gains more
         else:  # Draw case
-            form_change_a = -5 + elo_diff  # Stronger team loses some points
-            form_change_b = 5 - elo_diff   # Weaker team gains some points
-
-        # Update form history for team_a (append the result and keep max 6)
+            form_change_a = -form_draw + elo_diff  # Stronger team loses some points
+            form_change_b = form_draw - elo_diff   # Weaker team gains some points
+
+        if self.params.form_mode == "decay":
+            # Decayed running sum: O(1) per match and no history to keep
+            day = day_number(match_date) if match_date is not None and self.params.form_half_life_days else None
+            self.recent_form_history[team_a] = (self.decayed_form(team_a, form_score_a, day) + form_change_a, [])
+            self.recent_form_history[team_b] = (self.decayed_form(team_b, form_score_b, day) + form_change_b, [])
+            self.store.touch(team_a, team_b)  # Form means come from the scores in this mode (see store.form_mean)
+            return
+
+        # Update form history for team_a (append the result and keep max form_window)
+        form_window = self.params.form_window
         form_a.append(form_change_a)
-        if len(form_a) > 6:
-            form_a.pop(0)  # Remove the oldest match after 6 matches
+        if len(form_a) > form_window:
+            form_a.pop(0)  # Remove the oldest match after form_window matches
 
-        # Update form history for team_b (append the result and keep max 6)
+        # Update form history for team_b (append the result and keep max form_window)
         form_b.append(form_change_b)
-        if len(form_b) > 6:
-            form_b.pop(0)  # Remove the oldest match after 6 matches
+        if len(form_b) > form_window:
+            form_b.pop(0)  # Remove the oldest match after form_window matches
 
         # Calculate total recent form for both teams
         total_form_a = self.calculate_total_recent_form(form_a)
@@ -114,6 +106,20 @@ class FormRatingSystem:
         self.recent_form_history[team_a] = (total_form_a, form_a)
         self.recent_form_history[team_b] = (total_form_b, form_b)
 
+        # Invalidate cached predictions of both teams and keep their form means current
+        self.store.touch(team_a, team_b)
+        self.store.form_means[team_a] = total_form_a / len(form_a)
+        self.store.form_means[team_b] = total_form_b / len(form_b)
+
+    def decayed_form(self, team, form_score, day=None):
+        """A team's form score decayed up to its next match, by matches or by days since its last match."""
+        if day is None:
+            return form_score * self.params.form_decay()
+        form_days = self.store.form_days
+        last_day = form_days.get(team)
+        form_days[team] = day
+        return form_score * self.params.form_decay(None if last_day is None else day - last_day)
+
     def update_elo(self, team_a, team_b, result):
         """Update Elo ratings based on match result using standard Elo formula."""
         elo_a, matches_a = self.get_team_data(team_a)[1]
@@ -128,9 +134,9 @@ class FormRatingSystem:
             score_a, score_b = 0.5, 0.5
 
         # Elo calculation
-        expected_a = 1 / (1 + 10 ** ((elo_b - elo_a) / 400))
+        expected_a = elo_expected_score(elo_a, elo_b, self.params.elo_scale)
         expected_b = 1 - expected_a
-        k_factor = 30  # You can modify the K-factor as needed
+        k_factor = self.params.k_factor
 
         new_elo_a = elo_a + k_factor * (score_a - expected_a)
         new_elo_b = elo_b + k_factor * (score_b - expected_b)
@@ -138,19 +144,59 @@ class FormRatingSystem:
         # Update Elo ratings and match counts
         self.elo_ratings[team_a] = [new_elo_a, matches_a + 1]
         self.elo_ratings[team_b] = [new_elo_b, matches_b + 1]
+        self.store.touch(team_a, team_b)
 
-    def update_match(self, team_a, team_b, result):
+    @timed("form.update_match")
+    def update_match(self, team_a, team_b, result, match_date=None):
         """Update both recent form and Elo after a match."""
         # Update recent form
-        self.update_form(team_a, team_b, result)
+        self.update_form(team_a, team_b, result, match_date)
 
         # Update Elo ratings
         self.update_elo(team_a, team_b, result)
 
+        # Inside a batch, defer saving until the batch ends or the flush interval is reached
+        if self._batch_depth:
+            self._pending_updates += 1
+            if self.flush_interval and self._pending_updates >= self.flush_interval:
+                self.flush()
+            return
+
         # Save the updated form and Elo data
         self.save_form()
         self.save_elo()
 
+    def flush(self):
+        """Write any pending in-memory updates to the form and Elo files."""
+        if self._pending_updates:
+            self.save_form()
+            self.save_elo()
+            self._pending_updates = 0
+
+    @contextmanager
+    def batch(self):
+        """Apply updates in memory and save them once when the block exits.
+
+        If the block raises, nothing further is written and the files keep
+        the state of the last flush.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+        if not self._batch_depth:
+            self.flush()
+
+    def update_matches(self, matches):
+        """Update form and Elo for an iterable of (team_a, team_b, result[, match_date]) and save once."""
+        count = 0
+        with self.batch():
+            for match in matches:
+                self.update_match(*match)
+                count += 1
+        return count
+
 # Example usage
 if __name__ == "__main__":
     form_system = FormRatingSystem()
@@ -169,9 +215,8 @@ if __name__ == "__main__":
         ("Bournemouth", "Southampton", "win_a"),
     ]
 
-    # Update form and Elo for each match
-    for team_a, team_b, result in match_results:
-        form_system.update_match(team_a, team_b, result)
+    # Update form and Elo for all matches, saving once at the end
+    form_system.update_matches(match_results)
 
     # Check updated recent form after processing match results
     print("Updated Recent Form:")
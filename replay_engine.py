@@ -0,0 +1,381 @@
+import argparse
+import time
+from itertools import repeat
+
+import numpy as np
+
+from binary_store import state_dtype
+from match_parser import RESULT_CODES, iter_matches
+from profiling import timed
+from rating_core import DEFAULT_RATING, ModelParams, day_number, elo_expected_score, form_mean
+from recent_form import FormRatingSystem
+
+# Elo scores for team_a and team_b, indexed by result code
+SCORE_A = np.array([1.0, 0.5, 0.0])
+SCORE_B = np.array([0.0, 0.5, 1.0])
+
+# Per-match values recorded by ReplayEngine.trace_encoded
+TRACE_COLUMNS = ("elo_a", "elo_b", "expected_a", "new_elo_a", "new_elo_b", "form_mean_a", "form_mean_b",
+                 "form_change_a", "form_change_b")
+
+
+class ReplayEngine:
+    def __init__(self, params=None, capacity=64):
+        """Initialize array-backed Elo and form state for fast season replays."""
+        self.params = params if params is not None else ModelParams()
+        self.k_factor = self.params.k_factor
+        self.form_window = form_window = self.params.form_window
+        self.form_decay = self.params.form_decay() if self.params.form_mode == "decay" else None  # Per-match decay factor
+        self.dated_decay = self.form_decay is not None and bool(self.params.form_half_life_days)  # Decay by days
+        # Base form changes before the Elo difference adjustment, indexed by result code
+        form_win, form_draw = self.params.form_win, self.params.form_draw
+        self.form_base_a = np.array([form_win, -form_draw, -form_win], dtype=float)
+        self.form_base_b = np.array([-form_win, form_draw, form_win], dtype=float)
+        self.team_ids = {}  # Team name -> integer id
+        self.team_names = []  # Integer id -> team name
+        self.ratings = np.full(capacity, 1500.0)
+        self.matches_played = np.zeros(capacity, dtype=np.int64)
+        self.form_score = np.zeros(capacity)
+        self.form_buffer = np.zeros((capacity, form_window))  # Ring buffer of recent form changes
+        self.form_length = np.zeros(capacity, dtype=np.int64)  # Number of valid entries in the ring
+        self.form_position = np.zeros(capacity, dtype=np.int64)  # Next slot to write in the ring
+        self.form_sum = np.zeros(capacity)  # Running sum of the ring, kept by _replay_loop
+        self.has_elo = np.zeros(capacity, dtype=bool)  # Team has an entry in the Elo table
+        self.has_form = np.zeros(capacity, dtype=bool)  # Team has an entry in the form table
+        self.last_day = np.full(capacity, np.nan)  # Day number of each team's last dated match (dated decay only)
+
+    @classmethod
+    def from_form_system(cls, form_system):
+        """Create an engine holding the same state and settings as a FormRatingSystem."""
+        engine = cls(params=form_system.params)
+        form_days = form_system.store.form_days if engine.dated_decay else None
+        engine.load_state(form_system.recent_form_history, form_system.elo_ratings, form_days)
+        return engine
+
+    def _grow(self, size):
+        """Grow all state arrays so they can hold at least `size` teams."""
+        capacity = len(self.ratings)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        extra = new_capacity - capacity
+        self.ratings = np.concatenate([self.ratings, np.full(extra, 1500.0)])
+        self.matches_played = np.concatenate([self.matches_played, np.zeros(extra, dtype=np.int64)])
+        self.form_score = np.concatenate([self.form_score, np.zeros(extra)])
+        self.form_buffer = np.concatenate([self.form_buffer, np.zeros((extra, self.form_window))])
+        self.form_length = np.concatenate([self.form_length, np.zeros(extra, dtype=np.int64)])
+        self.form_position = np.concatenate([self.form_position, np.zeros(extra, dtype=np.int64)])
+        self.form_sum = np.concatenate([self.form_sum, np.zeros(extra)])
+        self.has_elo = np.concatenate([self.has_elo, np.zeros(extra, dtype=bool)])
+        self.has_form = np.concatenate([self.has_form, np.zeros(extra, dtype=bool)])
+        self.last_day = np.concatenate([self.last_day, np.full(extra, np.nan)])
+
+    def team_id(self, team):
+        """Get the integer id of a team, interning it if it is new."""
+        team_id = self.team_ids.get(team)
+        if team_id is None:
+            team_id = len(self.team_names)
+            self._grow(team_id + 1)
+            self.team_ids[team] = team_id
+            self.team_names.append(team)
+        return team_id
+
+    def load_state(self, recent_form_history, elo_ratings, form_days=None):
+        """Load state from FormRatingSystem-style form and Elo dictionaries, and {team: last match day} if given."""
+        for team, (rating, matches_played) in elo_ratings.items():
+            team_id = self.team_id(team)
+            self.ratings[team_id] = rating
+            self.matches_played[team_id] = matches_played
+            self.has_elo[team_id] = True
+        for team, (form_score, form_history) in recent_form_history.items():
+            team_id = self.team_id(team)
+            history = list(form_history)[-self.form_window:] if self.form_decay is None else []
+            self.form_buffer[team_id, :len(history)] = history
+            self.form_length[team_id] = len(history)
+            self.form_position[team_id] = len(history) % self.form_window
+            self.form_sum[team_id] = sum(history)
+            self.form_score[team_id] = form_score
+            self.has_form[team_id] = True
+        for team, day in (form_days or {}).items():
+            self.last_day[self.team_id(team)] = day
+
+    def load_array(self, state):
+        """Load state from a structured array (see binary_store), e.g. a memory-mapped file."""
+        if state["form_history"].shape[1] != self.form_window:
+            raise ValueError(f"State has a form window of {state['form_history'].shape[1]}, expected {self.form_window}.")
+        ids = np.array([self.team_id(team) for team in state["team"].tolist()], dtype=np.int64)
+        elo_ids = ids[state["has_elo"]]
+        self.ratings[elo_ids] = state["rating"][state["has_elo"]]
+        self.matches_played[elo_ids] = state["matches_played"][state["has_elo"]]
+        self.has_elo[elo_ids] = True
+        form_ids = ids[state["has_form"]]
+        self.form_buffer[form_ids] = state["form_history"][state["has_form"]]
+        self.form_length[form_ids] = state["form_length"][state["has_form"]]
+        self.form_position[form_ids] = self.form_length[form_ids] % self.form_window
+        self.form_sum[form_ids] = [sum(row) for row in state["form_history"][state["has_form"]].tolist()]
+        self.form_score[form_ids] = state["form_score"][state["has_form"]]
+        if self.form_decay is not None:
+            self.form_length[form_ids] = 0  # Decay mode keeps no history
+            self.form_sum[form_ids] = 0.0
+        self.has_form[form_ids] = True
+
+    def to_array(self):
+        """Export state as a structured array (see binary_store)."""
+        count = len(self.team_names)
+        ids = np.arange(count)
+        state = np.zeros(count, dtype=state_dtype(max(map(len, self.team_names), default=1), self.form_window))
+        state["team"] = self.team_names
+        state["rating"] = self.ratings[:count]
+        state["matches_played"] = self.matches_played[:count]
+        state["form_score"] = self.form_score[:count]
+        state["form_length"] = self.form_length[:count]
+        state["form_history"] = self.ordered_form(ids)
+        state["has_elo"] = self.has_elo[:count]
+        state["has_form"] = self.has_form[:count]
+        return state
+
+    def regress_ratings(self, fraction=None):
+        """Move every rating `fraction` of the way back to 1500, e.g. between seasons (default: params.season_regression)."""
+        fraction = self.params.season_regression if fraction is None else fraction
+        count = len(self.team_names)
+        rated = self.has_elo[:count]
+        self.ratings[:count][rated] = DEFAULT_RATING + (1 - fraction) * (self.ratings[:count][rated] - DEFAULT_RATING)
+
+    def encode_matches(self, matches):
+        """Convert (team_a, team_b, result[, match_date]) tuples into id and result code arrays."""
+        ids_a, ids_b, results = [], [], []
+        for team_a, team_b, result, *_ in matches:
+            ids_a.append(self.team_id(team_a))
+            ids_b.append(self.team_id(team_b))
+            results.append(RESULT_CODES.get(result, RESULT_CODES["draw"]))  # Unknown results count as draws
+        return (np.array(ids_a, dtype=np.int64), np.array(ids_b, dtype=np.int64),
+                np.array(results, dtype=np.int64))
+
+    @staticmethod
+    def encode_days(matches):
+        """Day numbers of (team_a, team_b, result[, match_date]) tuples, NaN for matches without a date."""
+        return np.array([day_number(match[3]) if len(match) > 3 and match[3] is not None else np.nan
+                         for match in matches], dtype=float)
+
+    def ordered_form(self, ids):
+        """Get the form history of the given teams oldest first, zero padded on the right."""
+        window = self.form_window
+        lengths = self.form_length[ids]
+        start = (self.form_position[ids] - lengths) % window
+        columns = (start[:, None] + np.arange(window)) % window
+        history = self.form_buffer[ids[:, None], columns]
+        history[np.arange(window) >= lengths[:, None]] = 0.0
+        return history
+
+    def expected_scores(self, ids_a, ids_b):
+        """Elo expected scores of team_a and team_b for each pair of ids."""
+        expected_a = elo_expected_score(self.ratings[ids_a], self.ratings[ids_b], self.params.elo_scale)
+        return expected_a, 1 - expected_a
+
+    def form_mean(self, ids):
+        """Average of each team's recent form history (0 for teams without history).
+
+        In decay mode this is the decay-weighted average of all form changes.
+        """
+        if self.form_decay is not None:
+            return form_mean((), self.form_score[ids], self.params)
+        lengths = self.form_length[ids]
+        return self.form_buffer[ids].sum(axis=1) / np.maximum(lengths, 1)
+
+    def _replay_loop(self, ids_a, ids_b, results, days=None, trace=None):
+        """Apply encoded matches one by one, mirroring FormRatingSystem.update_match.
+
+        Each match depends on the ones before it and only touches two teams,
+        so the state is unpacked into Python lists and updated with plain
+        float arithmetic, which avoids NumPy's per-call overhead, and written
+        back to the arrays at the end. In window mode every team's form
+        changes stay in their ring (slot team_id * form_window + position)
+        next to a running window sum: a match overwrites the oldest slot and
+        adjusts the sum by the difference, and the sum is recomputed once per
+        lap of the ring so rounding errors do not build up. days are used for
+        dated decay as in FormRatingSystem.decayed_form. With a `trace` list,
+        one tuple of TRACE_COLUMNS is appended per match.
+
+        The loop is still interpreted Python, so it runs about 2.2x as fast
+        as replaying through FormRatingSystem's dictionaries (see the ingest
+        benchmark), not orders of magnitude faster.
+        """
+        window = self.form_window
+        decay = self.form_decay
+        ratings = self.ratings.tolist()
+        played = self.matches_played.tolist()
+        scores = self.form_score.tolist()
+        if decay is None:
+            buffer = self.form_buffer.ravel().tolist()
+            lengths = self.form_length.tolist()
+            positions = self.form_position.tolist()
+            window_sums = self.form_sum.tolist()
+
+        base_a, base_b = self.form_base_a.tolist(), self.form_base_b.tolist()
+        score_a, score_b = SCORE_A.tolist(), SCORE_B.tolist()
+        k_factor, elo_scale, elo_diff_scale = self.k_factor, self.params.elo_scale, self.params.elo_diff_scale
+        dated = self.dated_decay and days is not None
+        last_day = self.last_day.tolist()
+        day_list = days.tolist() if dated else repeat(np.nan)
+        form_decay = self.params.form_decay
+        for team_a, team_b, result, day in zip(ids_a.tolist(), ids_b.tolist(), results.tolist(), day_list):
+            elo_a = ratings[team_a]
+            elo_b = ratings[team_b]
+
+            # Form update uses the Elo ratings from before the match
+            elo_diff = (elo_b - elo_a) / elo_diff_scale
+            form_change_a = base_a[result] + elo_diff
+            form_change_b = base_b[result] - elo_diff
+            if decay is None:
+                if trace is not None:
+                    form_mean_a = window_sums[team_a] / lengths[team_a] if lengths[team_a] else 0.0
+                    form_mean_b = window_sums[team_b] / lengths[team_b] if lengths[team_b] else 0.0
+                start = team_a * window
+                slot = start + positions[team_a]
+                if lengths[team_a] == window:
+                    window_sums[team_a] += form_change_a - buffer[slot]  # Overwrite the oldest change
+                else:
+                    lengths[team_a] += 1
+                    window_sums[team_a] += form_change_a
+                buffer[slot] = form_change_a
+                if slot + 1 == start + window:
+                    positions[team_a] = 0
+                    window_sums[team_a] = sum(buffer[start:slot + 1])
+                else:
+                    positions[team_a] += 1
+                scores[team_a] = window_sums[team_a]
+
+                start = team_b * window
+                slot = start + positions[team_b]
+                if lengths[team_b] == window:
+                    window_sums[team_b] += form_change_b - buffer[slot]
+                else:
+                    lengths[team_b] += 1
+                    window_sums[team_b] += form_change_b
+                buffer[slot] = form_change_b
+                if slot + 1 == start + window:
+                    positions[team_b] = 0
+                    window_sums[team_b] = sum(buffer[start:slot + 1])
+                else:
+                    positions[team_b] += 1
+                scores[team_b] = window_sums[team_b]
+            else:
+                if trace is not None:
+                    form_mean_a = form_mean((), scores[team_a], self.params)
+                    form_mean_b = form_mean((), scores[team_b], self.params)
+                decay_a = decay_b = decay
+                if day == day:  # Dated match (NaN is never equal to itself)
+                    # Decay by the days since each team's last dated match, if it had one
+                    if last_day[team_a] == last_day[team_a]:
+                        decay_a = form_decay(day - last_day[team_a])
+                    if last_day[team_b] == last_day[team_b]:
+                        decay_b = form_decay(day - last_day[team_b])
+                    last_day[team_a] = last_day[team_b] = day
+                scores[team_a] = scores[team_a] * decay_a + form_change_a
+                scores[team_b] = scores[team_b] * decay_b + form_change_b
+
+            # Standard Elo update
+            expected_a = elo_expected_score(elo_a, elo_b, elo_scale)
+            new_elo_a = elo_a + k_factor * (score_a[result] - expected_a)
+            new_elo_b = elo_b + k_factor * (score_b[result] - (1 - expected_a))
+            ratings[team_a] = new_elo_a
+            ratings[team_b] = new_elo_b
+            played[team_a] += 1
+            played[team_b] += 1
+            if trace is not None:
+                trace.append((elo_a, elo_b, expected_a, new_elo_a, new_elo_b, form_mean_a, form_mean_b,
+                              form_change_a, form_change_b))
+
+        self.ratings[:] = ratings
+        self.matches_played[:] = played
+        self.form_score[:] = scores
+        if dated:
+            self.last_day[:] = last_day
+        if decay is None:
+            self.form_buffer[:] = np.array(buffer).reshape(-1, window)
+            self.form_length[:] = lengths
+            self.form_position[:] = positions
+            self.form_sum[:] = window_sums
+
+    def replay(self, matches):
+        """Replay an iterable of (team_a, team_b, result[, match_date]) tuples in order.
+
+        Match dates are only used for dated decay (params.form_half_life_days).
+        """
+        matches = list(matches)
+        ids_a, ids_b, results = self.encode_matches(matches)
+        self.replay_encoded(ids_a, ids_b, results, self.encode_days(matches) if self.dated_decay else None)
+        return len(results)
+
+    @timed("engine.replay_encoded")
+    def replay_encoded(self, ids_a, ids_b, results, days=None):
+        """Replay matches already encoded as id and result code arrays, with optional day numbers (see encode_days)."""
+        self.has_elo[ids_a] = self.has_elo[ids_b] = True
+        self.has_form[ids_a] = self.has_form[ids_b] = True
+        self._replay_loop(ids_a, ids_b, results, days)
+
+    @timed("engine.trace_encoded")
+    def trace_encoded(self, ids_a, ids_b, results, days=None):
+        """Replay encoded matches like replay_encoded and return {column: array} of TRACE_COLUMNS, one row per match.
+
+        Ratings, expected scores and form means are from before each match.
+        """
+        self.has_elo[ids_a] = self.has_elo[ids_b] = True
+        self.has_form[ids_a] = self.has_form[ids_b] = True
+        trace = []
+        self._replay_loop(ids_a, ids_b, results, days, trace)
+        columns = np.array(trace, dtype=float).reshape(len(trace), len(TRACE_COLUMNS))
+        return {name: columns[:, index] for index, name in enumerate(TRACE_COLUMNS)}
+
+    def to_dicts(self):
+        """Export state as FormRatingSystem-style (recent_form_history, elo_ratings) dictionaries."""
+        recent_form_history = {}
+        elo_ratings = {}
+        ids = np.arange(len(self.team_names))
+        histories = self.ordered_form(ids).tolist()
+        for team_id, team in enumerate(self.team_names):
+            if self.has_form[team_id]:
+                history = histories[team_id][:self.form_length[team_id]]
+                recent_form_history[team] = (float(self.form_score[team_id]), history)
+            if self.has_elo[team_id]:
+                elo_ratings[team] = [float(self.ratings[team_id]), int(self.matches_played[team_id])]
+        return recent_form_history, elo_ratings
+
+    def export_to(self, form_system):
+        """Copy the engine state into a FormRatingSystem (without saving it)."""
+        recent_form_history, elo_ratings = self.to_dicts()
+        # Update in place, since the dictionaries are shared through the store
+        form_system.recent_form_history.clear()
+        form_system.recent_form_history.update(recent_form_history)
+        form_system.elo_ratings.clear()
+        form_system.elo_ratings.update(elo_ratings)
+        if self.dated_decay:
+            form_days = form_system.store.form_days
+            form_days.clear()
+            form_days.update({team: int(day) for team, day in zip(self.team_names, self.last_day.tolist()) if day == day})
+        form_system.store.invalidate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay match files into Elo and form state.")
+    parser.add_argument("match_files", nargs="+", help="Match files in the (\"A\", \"B\", \"result\") format")
+    parser.add_argument("--form-file", default="recent_form.txt")
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--save", action="store_true", help="Write the replayed state to the form and Elo files")
+    args = parser.parse_args()
+
+    matches = []
+    for match_file in args.match_files:
+        matches.extend(iter_matches(match_file))
+
+    form_system = FormRatingSystem(form_file=args.form_file, elo_file=args.elo_file)
+    engine = ReplayEngine.from_form_system(form_system)
+    start_time = time.perf_counter()
+    engine.replay(matches)
+    elapsed = time.perf_counter() - start_time
+    print(f"Replayed {len(matches)} matches in {elapsed:.4f}s")
+
+    if args.save:
+        engine.export_to(form_system)
+        form_system.save_form()
+        form_system.save_elo()
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from match_parser import RESULT_CODES, MatchParseError, iter_matches, iter_numbered_fixtures
+from rating_core import DEFAULT_RATING, EloRatingSystem, draw_adjusted_probabilities, elo_expected_score
+
+POINTS = np.array([[3, 1, 0], [0, 1, 3]])  # Points of team_a and team_b for win_a, draw, win_b
+
+
+def rating_probabilities(rating_a, rating_b, params):
+    """(win_a, draw, win_b) probabilities as predict_match computes them, for arrays of ratings."""
+    expected_a = elo_expected_score(rating_a, rating_b, params.elo_scale)
+    return draw_adjusted_probabilities(expected_a, 1 - expected_a, params.max_draw_prob, params.min_draw_prob)
+
+
+def fixture_batches(ids_a, ids_b):
+    """Yield arrays of fixture indices whose ratings can be updated together, in fixture order.
+
+    Each fixture is scheduled one level after the latest earlier fixture of
+    either of its teams, so fixtures sharing a level touch disjoint teams
+    and every team still plays its fixtures in their original order.
+    """
+    if not len(ids_a):
+        return
+    last_level = {}
+    levels = []
+    for team_a, team_b in zip(ids_a.tolist(), ids_b.tolist()):
+        level = max(last_level.get(team_a, -1), last_level.get(team_b, -1)) + 1
+        last_level[team_a] = last_level[team_b] = level
+        levels.append(level)
+    levels = np.array(levels)
+    order = np.argsort(levels, kind="stable")
+    bounds = np.flatnonzero(np.diff(levels[order])) + 1
+    yield from np.split(order, bounds)
+
+
+def sample_outcomes(rng, win_a, draw):
+    """Sample result codes from win_a and draw probabilities of any shape."""
+    roll = rng.random(np.shape(win_a))
+    return (roll >= win_a).astype(np.int64) + (roll >= win_a + draw)
+
+
+def simulate_chunk(task):
+    """Simulate one chunk of seasons; returns (position counts, summed points).
+
+    Runs in a worker process. Position counts have shape (teams, teams):
+    [team, position] is the number of seasons the team finished there.
+    """
+    ratings, start_points, ids_a, ids_b, seasons, update_ratings, params, seed = task
+    rng = np.random.default_rng(seed)
+    team_count = len(ratings)
+    points = np.tile(start_points, (seasons, 1)).astype(np.int64)
+
+    if update_ratings:
+        # Every simulated season keeps its own ratings, updated after each match in fixture order
+        path_ratings = np.tile(ratings, (seasons, 1))
+        for batch in fixture_batches(ids_a, ids_b):
+            batch_a, batch_b = ids_a[batch], ids_b[batch]
+            rating_a, rating_b = path_ratings[:, batch_a], path_ratings[:, batch_b]
+            win_a, draw, _ = rating_probabilities(rating_a, rating_b, params)
+            outcomes = sample_outcomes(rng, win_a, draw)
+            expected_a = elo_expected_score(rating_a, rating_b, params.elo_scale)
+            score_a = (2 - outcomes) / 2  # 1 for win_a, 0.5 for a draw, 0 for win_b
+            change = params.k_factor * (score_a - expected_a)
+            path_ratings[:, batch_a] += change
+            path_ratings[:, batch_b] -= change
+            points[:, batch_a] += POINTS[0][outcomes]
+            points[:, batch_b] += POINTS[1][outcomes]
+    elif len(ids_a):
+        # Fixed ratings: sample every fixture at once and add points through the fixture/team incidence
+        win_a, draw, _ = rating_probabilities(ratings[ids_a], ratings[ids_b], params)
+        outcomes = sample_outcomes(rng, np.broadcast_to(win_a, (seasons, len(ids_a))), draw)
+        fixtures = np.arange(len(ids_a))
+        home = np.zeros((len(ids_a), team_count))
+        away = np.zeros((len(ids_a), team_count))
+        home[fixtures, ids_a] = 1
+        away[fixtures, ids_b] = 1
+        # Float matrix products use BLAS and are exact for these small integers
+        points += np.rint(POINTS[0][outcomes].astype(float) @ home + POINTS[1][outcomes].astype(float) @ away).astype(np.int64)
+
+    # Rank by points; ties are broken at random since goal difference is not simulated
+    order = np.argsort(-(points + rng.random(points.shape) * 0.5), axis=1)  # [season, position] -> team
+    position_counts = np.bincount((order * team_count + np.arange(team_count)).ravel(),
+                                  minlength=team_count * team_count).reshape(team_count, team_count)
+    return position_counts, points.sum(axis=0)
+
+
+def current_points(teams, played_matches):
+    """League points of each team from the matches already played this season."""
+    team_ids = {team: index for index, team in enumerate(teams)}
+    points = np.zeros(len(teams), dtype=np.int64)
+    for team_a, team_b, result in played_matches:
+        code = RESULT_CODES.get(result, RESULT_CODES["draw"])
+        points[team_ids[team_a]] += POINTS[0][code]
+        points[team_ids[team_b]] += POINTS[1][code]
+    return points
+
+
+def simulate_season(elo_system, fixtures, played_matches=(), seasons=100_000, update_ratings=False,
+                    chunk_size=10_000, workers=None, seed=0):
+    """Monte Carlo simulation of the rest of a season from the current Elo ratings.
+
+    fixtures are the remaining (team_a, team_b) matches in order and
+    played_matches the (team_a, team_b, result) matches that count towards
+    the table already. With update_ratings, ratings change after every
+    simulated match as in update_elo. Seasons are simulated chunk_size at a
+    time across worker processes, and only position counts are kept, so
+    memory does not grow with the number of seasons. Returns {"teams",
+    "position_counts", "expected_points", "seasons", "unrated"}, where
+    unrated lists the teams without a rating, which start at DEFAULT_RATING.
+    """
+    params = elo_system.params
+    played_matches = list(played_matches)
+    teams = list(dict.fromkeys([team for fixture in fixtures for team in fixture]
+                               + [team for match in played_matches for team in match[:2]]))
+    team_ids = {team: index for index, team in enumerate(teams)}
+    unrated = [team for team in teams if team not in elo_system.ratings]
+    ratings = np.array([elo_system.ratings.get(team, [DEFAULT_RATING, 0])[0] for team in teams], dtype=float)
+    ids_a = np.array([team_ids[team_a] for team_a, _ in fixtures], dtype=np.int64)
+    ids_b = np.array([team_ids[team_b] for _, team_b in fixtures], dtype=np.int64)
+    start_points = current_points(teams, played_matches)
+
+    chunks = [min(chunk_size, seasons - start) for start in range(0, seasons, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(ratings, start_points, ids_a, ids_b, count, update_ratings, params, chunk_seed)
+             for count, chunk_seed in zip(chunks, seeds)]
+
+    position_counts = np.zeros((len(teams), len(teams)), dtype=np.int64)
+    total_points = np.zeros(len(teams), dtype=np.int64)
+
+    def add(results):
+        # Chunk results are summed as they arrive, so only one chunk per worker is held at a time
+        for chunk_counts, chunk_points in results:
+            position_counts[...] += chunk_counts
+            total_points[...] += chunk_points
+
+    if workers == 1 or len(tasks) <= 1:
+        add(map(simulate_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            add(executor.map(simulate_chunk, tasks))
+    return {"teams": teams, "position_counts": position_counts, "expected_points": total_points / max(seasons, 1),
+            "seasons": seasons, "unrated": unrated}
+
+
+def summarize(result, relegated=3, top=4):
+    """Rows per team with expected points and title, top-N, relegation and position probabilities."""
+    seasons = max(result["seasons"], 1)
+    probabilities = result["position_counts"] / seasons
+    rows = []
+    for index, team in enumerate(result["teams"]):
+        rows.append({
+            "team": team,
+            "expected_points": float(result["expected_points"][index]),
+            "title": float(probabilities[index, 0]),
+            f"top_{top}": float(probabilities[index, :top].sum()),
+            "relegation": float(probabilities[index, len(result["teams"]) - relegated:].sum()) if relegated else 0.0,
+            "positions": probabilities[index].tolist(),
+        })
+    rows.sort(key=lambda row: -row["expected_points"])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the rest of a season and estimate final table probabilities.")
+    parser.add_argument("fixture_file", help="Remaining (\"A\", \"B\") fixtures in order, or - for stdin")
+    parser.add_argument("--played", nargs="*", default=[], help="Match files already played this season")
+    parser.add_argument("--elo-file", default="teams.txt")
+    parser.add_argument("--seasons", type=int, default=100_000)
+    parser.add_argument("--update-ratings", action="store_true", help="Update ratings after each simulated match")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Seasons simulated at once per task")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--relegated", type=int, default=3, help="Number of relegation places")
+    parser.add_argument("--top", type=int, default=4, help="Report the probability of finishing in the top N")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.fixture_file == "-" else args.fixture_file
+    try:
+        fixture_list = [fixture for _, fixture in iter_numbered_fixtures(source)]
+    except MatchParseError as error:
+        sys.exit(f"Invalid fixture file: {error}")
+    played = [match for match_file in args.played for match in iter_matches(match_file)]
+
+    simulation = simulate_season(EloRatingSystem(file_path=args.elo_file), fixture_list, played, args.seasons,
+                                 args.update_ratings, args.chunk_size, args.workers, args.seed)
+    table = summarize(simulation, args.relegated, args.top)
+    if simulation["unrated"] and args.format != "json":
+        print(f"Teams without a rating start at {DEFAULT_RATING}: {', '.join(simulation['unrated'])}", file=sys.stderr)
+    if args.format == "json":
+        json.dump({"seasons": args.seasons, "table": table, "unrated": simulation["unrated"]}, sys.stdout, indent=2)
+        print()
+    elif args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        positions = len(simulation["teams"])
+        writer.writerow(["team", "expected_points", "title", f"top_{args.top}", "relegation",
+                         *(f"position_{position}" for position in range(1, positions + 1))])
+        for row in table:
+            writer.writerow([row["team"], f"{row['expected_points']:.2f}", f"{row['title']:.4f}",
+                             f"{row[f'top_{args.top}']:.4f}", f"{row['relegation']:.4f}",
+                             *(f"{value:.4f}" for value in row["positions"])])
+    else:
+        print(f"{'Team':<25} {'Points':>7} {'Title':>7} {'Top ' + str(args.top):>7} {'Releg.':>7}")
+        for row in table:
+            print(f"{row['team']:<25} {row['expected_points']:7.1f} {row['title']:7.2%} "
+                  f"{row[f'top_{args.top}']:7.2%} {row['relegation']:7.2%}")
@@ -1,25 +1,18 @@
+from ranking import RankingIndex, write_ranked
+from rating_core import TeamStore
+
 # Define the function to sort teams by their rating and save to a new file
 def sort_teams_by_rating(input_file_path, output_file_path):
-    # Open the input file and read the content
-    with open(input_file_path, 'r') as file:
-        data = file.readlines()
-    
-    # Convert the input data into a list of tuples (team, rating, matches_played)
-    team_data = [(line.rsplit(" ", 2)[0], float(line.rsplit(" ", 2)[1]), int(line.rsplit(" ", 2)[2])) for line in data if line.strip()]
-    
-    # Sort by rating in descending order
-    sorted_teams = sorted(team_data, key=lambda x: x[1], reverse=True)
-    
-    # Write the sorted data to the output file
-    with open(output_file_path, 'w') as file:
-        for team, rating, matches_played in sorted_teams:
-            file.write(f"{team} {int(rating)} {matches_played}\n")
+    # Rank the teams of the Elo file; ranking.py shows leaderboards without writing files
+    index = RankingIndex(TeamStore(elo_file=input_file_path), boards=("elo",))  # Only the Elo file is read
+    write_ranked(index, "elo", output_file_path)
 
-# Specify the file paths
-input_file_path = 'teams.txt'  # Input file (original file with team data)
-output_file_path = 'teams_sorted.txt'  # Output file (sorted version)
+if __name__ == "__main__":
+    # Specify the file paths
+    input_file_path = 'teams.txt'  # Input file (original file with team data)
+    output_file_path = 'teams_sorted.txt'  # Output file (sorted version)
 
-# Call the function to sort by rating and update the output file
-sort_teams_by_rating(input_file_path, output_file_path)
+    # Call the function to sort by rating and update the output file
+    sort_teams_by_rating(input_file_path, output_file_path)
 
-print(f"Teams sorted by rating and saved to {output_file_path}.")
+    print(f"Teams sorted by rating and saved to {output_file_path}.")
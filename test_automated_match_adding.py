@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import automated_match_adding
+from automated_match_adding import process_matches_in_batches
+from benchmark import synthetic_matches, synthetic_teams, write_matches
+from rating_core import clear_stores
+from recent_form import FormRatingSystem
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.matches = synthetic_matches(synthetic_teams(12), 300, seed=2)
+        self.match_file = self.path("matches.txt")
+        self.checkpoint_file = self.path("checkpoint.json")
+        write_matches(self.match_file, self.matches)
+        for name in ("teams.txt", "recent_form.txt"):
+            open(self.path(name), 'w').close()
+
+    def tearDown(self):
+        clear_stores()
+        self.work_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.work_dir.name, name)
+
+    def form_system(self, **kwargs):
+        """FormRatingSystem freshly loaded from the state files in the work directory."""
+        clear_stores()
+        return FormRatingSystem(form_file=self.path("recent_form.txt"), elo_file=self.path("teams.txt"), **kwargs)
+
+    def ingest(self, form_system, batch_size=50):
+        return process_matches_in_batches(form_system, self.match_file, batch_size=batch_size,
+                                          checkpoint_file=self.checkpoint_file)
+
+    def interrupt_at_match(self, form_system, match_count):
+        """Make the form system raise Interrupted when it is about to apply its match_count-th match."""
+        update_match = form_system.update_match
+        applied = [0]
+
+        def interrupted_update_match(*match):
+            applied[0] += 1
+            if applied[0] == match_count:
+                raise Interrupted
+            update_match(*match)
+        form_system.update_match = interrupted_update_match
+
+    def matches_played(self):
+        """Matches played summed over the teams in the saved Elo file, two per match."""
+        return sum(matches_played for _, matches_played in self.form_system().elo_ratings.values())
+
+    def test_resume_with_flush_interval(self):
+        form_system = self.form_system(flush_interval=10)
+        self.interrupt_at_match(form_system, 126)
+        with self.assertRaises(Interrupted):
+            self.ingest(form_system)
+        self.assertEqual(form_system.flush_interval, 10)
+        self.assertEqual(self.matches_played(), 2 * 100)  # Only the two whole batches were saved
+
+        self.assertEqual(self.ingest(self.form_system(flush_interval=10)), 200)
+        self.assertEqual(self.matches_played(), 2 * len(self.matches))
+
+    def resume_after_checkpoint_save(self, interrupted_save):
+        """Interrupt the ingest at the interrupted_save-th checkpoint save and resume it; returns the matches resumed."""
+        save_checkpoint = automated_match_adding.save_checkpoint
+        saves = [0]
+
+        def interrupted_save_checkpoint(checkpoint_file, checkpoint):
+            saves[0] += 1
+            if saves[0] == interrupted_save:
+                raise Interrupted
+            save_checkpoint(checkpoint_file, checkpoint)
+        with mock.patch.object(automated_match_adding, "save_checkpoint", interrupted_save_checkpoint):
+            with self.assertRaises(Interrupted):
+                self.ingest(self.form_system())
+        return self.ingest(self.form_system())
+
+    def test_resume_saved_pending_batch(self):
+        # The fourth save would move the checkpoint past the second batch, which is already saved
+        self.assertEqual(self.resume_after_checkpoint_save(4), 200)
+        self.assertEqual(self.matches_played(), 2 * len(self.matches))
+
+    def test_resume_unsaved_pending_batch(self):
+        # The third save would mark the second batch as pending, so nothing of it was saved
+        self.assertEqual(self.resume_after_checkpoint_save(3), 250)
+        self.assertEqual(self.matches_played(), 2 * len(self.matches))
+
+    def test_half_saved_batch_is_rejected(self):
+        form_system = self.form_system()
+        save_elo = form_system.save_elo
+        saves = [0]
+
+        def interrupted_save_elo():
+            saves[0] += 1
+            if saves[0] == 2:
+                raise Interrupted
+            save_elo()
+        form_system.save_elo = interrupted_save_elo
+        with self.assertRaises(Interrupted):
+            self.ingest(form_system)
+        with self.assertRaises(ValueError):
+            self.ingest(self.form_system())
+
+    def test_old_checkpoint_format(self):
+        with open(self.checkpoint_file, 'w') as file:
+            file.write(f'{{"{os.path.abspath(self.match_file)}": 120}}\n')
+        self.assertEqual(self.ingest(self.form_system()), 180)
+
+    def test_invalid_lines_are_counted(self):
+        with open(self.match_file, 'a') as file:
+            file.write('("Team 000", "Team 001", "lost"),\nnot a match\n')
+        errors = []
+        processed = process_matches_in_batches(self.form_system(), self.match_file, batch_size=50, errors=errors)
+        self.assertEqual(processed, len(self.matches))
+        self.assertEqual([error.line_number for error in errors], [301, 302])
+
+
+if __name__ == "__main__":
+    unittest.main()
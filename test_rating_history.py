@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from benchmark import synthetic_matches, synthetic_teams
+from rating_history import RatingHistory
+from replay_engine import ReplayEngine
+
+
+class RatingHistoryReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.matches = synthetic_matches(synthetic_teams(12), 400, seed=3)
+        self.history = RatingHistory(checkpoint_interval=50)
+        self.history.record(self.matches)
+
+    def assert_same_state(self, engine, expected):
+        recent_form_history, elo_ratings = engine.to_dicts()
+        expected_form_history, expected_elo_ratings = expected.to_dicts()
+        self.assertEqual(set(elo_ratings), set(expected_elo_ratings))
+        self.assertEqual(set(recent_form_history), set(expected_form_history))
+        for team, (rating, matches_played) in expected_elo_ratings.items():
+            self.assertEqual(elo_ratings[team][1], matches_played, team)
+            self.assertAlmostEqual(elo_ratings[team][0], rating, places=9, msg=team)
+        for team, (form_score, form_history) in expected_form_history.items():
+            self.assertAlmostEqual(recent_form_history[team][0], form_score, places=9, msg=team)
+            self.assertEqual(len(recent_form_history[team][1]), len(form_history), team)
+            for change, expected_change in zip(recent_form_history[team][1], form_history):
+                self.assertAlmostEqual(change, expected_change, places=9, msg=team)
+
+    def full_replay(self, matches):
+        """A fresh engine that replayed every match from the start."""
+        engine = ReplayEngine()
+        engine.replay(matches)
+        return engine
+
+    def test_correct(self):
+        corrected = list(self.matches)
+        team_a, team_b, result = corrected[123]
+        corrected[123] = (team_a, team_b, "win_b" if result != "win_b" else "win_a")
+        self.assertEqual(self.history.correct(123, corrected[123]), len(corrected) - 123)
+        self.assert_same_state(self.history.engine, self.full_replay(corrected))
+        self.assertEqual(self.history.decode_matches(), corrected)
+
+    def test_insert_new_team(self):
+        corrected = list(self.matches)
+        corrected.insert(250, ("Team 003", "Promoted", "draw"))
+        self.history.insert(250, corrected[250])
+        self.assert_same_state(self.history.engine, self.full_replay(corrected))
+        self.assertEqual(self.history.match_count, len(corrected))
+
+    def test_sync(self):
+        corrected = list(self.matches)
+        team_a, team_b, _ = corrected[180]
+        corrected[180] = (team_b, team_a, "draw")
+        corrected.insert(301, ("Team 007", "Team 002", "win_a"))
+        corrected.extend(synthetic_matches(synthetic_teams(12), 30, seed=4))
+        self.assertEqual(self.history.sync(corrected), (180, len(corrected) - 180))
+        self.assert_same_state(self.history.engine, self.full_replay(corrected))
+        self.assertEqual(self.history.sync(corrected), (len(corrected), 0))
+
+    def test_snapshot_between_checkpoints(self):
+        seq = 137
+        snapshot = self.history.snapshot(seq)
+        self.assert_same_state(snapshot, self.full_replay(self.matches[:seq]))
+        for team, team_id in snapshot.team_ids.items():
+            if snapshot.has_elo[team_id]:
+                self.assertAlmostEqual(self.history.rating_at(team, seq), snapshot.ratings[team_id], places=9)
+        with self.assertRaises(ValueError):
+            self.history.snapshot(len(self.matches) + 1)
+
+    def test_save_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            file_path = os.path.join(work_dir, "history.npz")
+            self.history.save(file_path)
+            loaded = RatingHistory.load(file_path)
+        self.assertEqual(loaded.match_count, self.history.match_count)
+        self.assertEqual(loaded.decode_matches(), self.matches)
+        self.assertEqual(sorted(loaded.checkpoints), sorted(self.history.checkpoints))
+        self.assert_same_state(loaded.engine, self.history.engine)
+
+        more = synthetic_matches(synthetic_teams(12), 60, seed=5)
+        loaded.record(more)
+        self.assert_same_state(loaded.engine, self.full_replay(self.matches + more))
+        team = self.matches[0][0]
+        self.assertEqual(loaded.team_matches(team)[:5].tolist(), self.history.team_matches(team)[:5].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from benchmark import synthetic_matches, synthetic_teams
+from optimize_weights import walk_forward_features
+from rating_core import ModelParams, clear_stores
+from recent_form import FormRatingSystem
+from replay_engine import ReplayEngine
+
+
+class ReplayEngineEquivalenceTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.matches = synthetic_matches(synthetic_teams(12), 600, seed=1)
+
+    def tearDown(self):
+        clear_stores()
+        self.work_dir.cleanup()
+
+    def form_system(self, params=None, elo_lines=(), form_lines=()):
+        """FormRatingSystem on fresh state files in the work directory."""
+        elo_file = os.path.join(self.work_dir.name, "teams.txt")
+        form_file = os.path.join(self.work_dir.name, "recent_form.txt")
+        with open(elo_file, 'w') as file:
+            file.writelines(elo_lines)
+        with open(form_file, 'w') as file:
+            file.writelines(form_lines)
+        clear_stores()
+        return FormRatingSystem(form_file=form_file, elo_file=elo_file, params=params)
+
+    def assert_same_state(self, form_system, engine):
+        recent_form_history, elo_ratings = engine.to_dicts()
+        self.assertEqual(set(elo_ratings), set(form_system.elo_ratings))
+        self.assertEqual(set(recent_form_history), set(form_system.recent_form_history))
+        for team, (rating, matches_played) in form_system.elo_ratings.items():
+            self.assertEqual(elo_ratings[team][1], matches_played, team)
+            self.assertAlmostEqual(elo_ratings[team][0], rating, places=9, msg=team)
+        for team, (form_score, form_history) in form_system.recent_form_history.items():
+            engine_score, engine_history = recent_form_history[team]
+            self.assertAlmostEqual(engine_score, form_score, places=9, msg=team)
+            self.assertEqual(len(engine_history), len(form_history), team)
+            for engine_change, change in zip(engine_history, form_history):
+                self.assertAlmostEqual(engine_change, change, places=9, msg=team)
+
+    def replay_both(self, params=None, **files):
+        form_system = self.form_system(params, **files)
+        engine = ReplayEngine.from_form_system(form_system)
+        engine.replay(self.matches)
+        for team_a, team_b, result in self.matches:
+            form_system.update_form(team_a, team_b, result)
+            form_system.update_elo(team_a, team_b, result)
+        self.assert_same_state(form_system, engine)
+
+    def test_window_mode(self):
+        self.replay_both()
+
+    def test_decay_mode(self):
+        self.replay_both(ModelParams(form_mode="decay"))
+
+    def test_loaded_state(self):
+        self.replay_both(elo_lines=["Team 000 1620 40\n", "Team 005 1410 40\n"],
+                         form_lines=["12.00 Team 000 5.00 -3.00 10.00\n"])
+
+    def test_replay_in_pieces(self):
+        whole = ReplayEngine()
+        whole.replay(self.matches)
+        pieces = ReplayEngine()
+        for start in range(0, len(self.matches), 37):
+            pieces.replay(self.matches[start:start + 37])
+        self.assertEqual(whole.to_dicts(), pieces.to_dicts())
+
+    def test_walk_forward_features(self):
+        form_system = self.form_system()
+        features = walk_forward_features(self.matches)
+        for index, (team_a, team_b, result) in enumerate(self.matches):
+            form_a = form_system.get_team_data(team_a)[0][1]
+            form_b = form_system.get_team_data(team_b)[0][1]
+            expected_a = 1 / (1 + 10 ** ((form_system.elo_ratings[team_b][0] - form_system.elo_ratings[team_a][0]) / 400))
+            self.assertAlmostEqual(features["expected_elo"][index], expected_a, places=12)
+            self.assertAlmostEqual(features["form_a"][index], sum(form_a) / len(form_a) if form_a else 0.0, places=9)
+            self.assertAlmostEqual(features["form_b"][index], sum(form_b) / len(form_b) if form_b else 0.0, places=9)
+            form_system.update_form(team_a, team_b, result)
+            form_system.update_elo(team_a, team_b, result)
+
+    def test_decay_form_means(self):
+        params = ModelParams(form_mode="decay")
+        form_system = self.form_system(params)
+        engine = ReplayEngine(params=params)
+        engine.replay(self.matches)
+        form_system.update_matches(self.matches)
+        for team, team_id in engine.team_ids.items():
+            self.assertAlmostEqual(form_system.store.form_mean(team, params), engine.form_mean([team_id])[0], places=9)
+
+    def test_decay_trace_form_changes(self):
+        params = ModelParams(form_mode="decay")
+        form_system = self.form_system(params)
+        engine = ReplayEngine(params=params)
+        trace = engine.trace_encoded(*engine.encode_matches(self.matches))
+        decay = params.form_decay()
+        for index, (team_a, team_b, result) in enumerate(self.matches):
+            score_a = form_system.get_team_data(team_a)[0][0]
+            form_system.update_form(team_a, team_b, result)
+            form_system.update_elo(team_a, team_b, result)
+            change_a = form_system.recent_form_history[team_a][0] - score_a * decay
+            self.assertAlmostEqual(trace["form_change_a"][index], change_a, places=9)
+
+    def test_dated_decay_mode(self):
+        params = ModelParams(form_mode="decay", form_half_life_days=14)
+        start = date(2023, 8, 1).toordinal()
+        dated = [(*match, date.fromordinal(start + index // 3 * 4)) for index, match in enumerate(self.matches)]
+        dated[5] = dated[5][:3]  # Matches without a date decay by one match
+        form_system = self.form_system(params)
+        engine = ReplayEngine.from_form_system(form_system)
+        engine.replay(dated[:300])
+        form_system.update_matches(dated[:300])
+        self.assert_same_state(form_system, engine)
+
+        # Days carry over through the store's sidecar file
+        engine.export_to(form_system)
+        form_system.save_form()
+        clear_stores()
+        form_system = FormRatingSystem(form_file=form_system.form_file, elo_file=form_system.elo_file, params=params)
+        engine = ReplayEngine.from_form_system(form_system)
+        engine.replay(dated[300:])
+        form_system.update_matches(dated[300:])
+        self.assert_same_state(form_system, engine)
+
+
+if __name__ == "__main__":
+    unittest.main()